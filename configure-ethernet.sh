@@ -158,3 +158,6 @@ echo "=========================================="
 echo ""
 echo "Verify with: ip addr show $ETH_INTERFACE"
 echo ""
+echo "For WebRTC viewers on this network, add to stream.json:"
+echo "  \"webrtc\": true, \"webrtc_hosts\": [\"$IP_ADDRESS\"]"
+echo ""
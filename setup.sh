@@ -25,14 +25,17 @@ echo "Home: $HOME_DIR"
 echo "Script directory: $SCRIPT_DIR"
 echo ""
 
+# rpiCameraSecondary (substreams) needs 1.11 or newer
+MEDIAMTX_VERSION="v1.11.3"
+
 # Detect architecture
 ARCH=$(uname -m)
 echo "Architecture: $ARCH"
 
 if [ "$ARCH" = "aarch64" ]; then
-    MEDIAMTX_URL="https://github.com/bluenviron/mediamtx/releases/download/v1.9.3/mediamtx_v1.9.3_linux_arm64v8.tar.gz"
+    MEDIAMTX_URL="https://github.com/bluenviron/mediamtx/releases/download/${MEDIAMTX_VERSION}/mediamtx_${MEDIAMTX_VERSION}_linux_arm64v8.tar.gz"
 elif [ "$ARCH" = "armv7l" ]; then
-    MEDIAMTX_URL="https://github.com/bluenviron/mediamtx/releases/download/v1.9.3/mediamtx_v1.9.3_linux_armv7.tar.gz"
+    MEDIAMTX_URL="https://github.com/bluenviron/mediamtx/releases/download/${MEDIAMTX_VERSION}/mediamtx_${MEDIAMTX_VERSION}_linux_armv7.tar.gz"
 else
     echo "Unsupported architecture: $ARCH"
     exit 1
@@ -48,9 +51,12 @@ echo "[2/6] Installing dependencies..."
 
 echo ""
 echo "[3/6] Installing MediaMTX..."
-if command -v mediamtx &> /dev/null; then
-    echo "MediaMTX already installed, skipping..."
+INSTALLED_VERSION=$(mediamtx --version 2>/dev/null || true)
+OLDEST=$(printf '%s\n%s\n' "$INSTALLED_VERSION" "$MEDIAMTX_VERSION" | sort -V | head -n1)
+if [ -n "$INSTALLED_VERSION" ] && [ "$OLDEST" = "$MEDIAMTX_VERSION" ]; then
+    echo "MediaMTX $INSTALLED_VERSION already installed, skipping..."
 else
+    [ -n "$INSTALLED_VERSION" ] && echo "Upgrading MediaMTX $INSTALLED_VERSION to $MEDIAMTX_VERSION..."
     TEMP_DIR=$(mktemp -d)
     cd "$TEMP_DIR"
     echo "Downloading MediaMTX..."
@@ -5,20 +5,273 @@ Reads configuration from ~/Desktop/stream.json and streams via MediaMTX.
 Uses MediaMTX's native Raspberry Pi camera support.
 """
 
+import argparse
+import asyncio
+import base64
+import contextlib
+import csv
+import ctypes
+import fcntl
+import hashlib
+import itertools
+import http.server
+import io
+import ipaddress
 import json
 import os
+import random
+import re
+import select
+import shutil
 import signal
 import socket
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
 from pathlib import Path
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field, fields, replace
+from fractions import Fraction
 from typing import Optional
 
 # Default config location
 CONFIG_PATH = Path.home() / "Desktop" / "stream.json"
 
+# Runtime files (PID file, generated MediaMTX config) live on tmpfs where
+# possible, so they never touch the SD card
+RUNTIME_DIR = Path(
+    os.environ.get("XDG_RUNTIME_DIR")
+    or ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+)
+
+# Records the PID of the MediaMTX process we launched, so a later start can
+# clean up after a crashed streamer without touching unrelated processes
+PID_PATH = RUNTIME_DIR / "rpi-rtsp-mediamtx.pid"
+
+# SoC temperature in millidegrees Celsius
+THERMAL_ZONE_PATH = Path("/sys/class/thermal/thermal_zone0/temp")
+
+# Encoder steps used by the thermal governor when `thermal_ladder` is empty.
+# Each level only ever lowers a stream's own settings.
+DEFAULT_THERMAL_LADDER = [
+    {"fps": 24},
+    {"fps": 20, "resolution": "1280x720"},
+    {"fps": 15, "resolution": "960x540", "bitrate": 1000000},
+]
+
+# Named encoder settings; a preset overrides the top-level profile, level,
+# bitrate and idr_period (entries in `streams` can still override them)
+ENCODER_PRESETS = {
+    # Baseline decodes with the least buffering everywhere; a short GOP heals
+    # lost packets within a few frames
+    "fpv-lowlatency": {"profile": "baseline", "level": "4.1", "bitrate": 4000000, "idr_period": 5},
+    # CABAC (High profile) needs fewer bits for the same picture; a long GOP
+    # suits mostly static scenes
+    "surveillance-efficient": {"profile": "high", "level": "4.1", "bitrate": 1500000,
+                               "idr_period": 60},
+    "archival": {"profile": "high", "level": "4.2", "bitrate": 12000000, "idr_period": 30},
+}
+
+# H.264 profiles and levels the Pi's hardware encoder accepts. Per level (Annex A):
+# max macroblocks/s, max macroblocks per frame, max Baseline/Main bitrate (kbit/s)
+H264_PROFILES = ("baseline", "main", "high")
+H264_LEVELS = {
+    "4.0": (245760, 8192, 20000),
+    "4.1": (245760, 8192, 50000),
+    "4.2": (522240, 8704, 50000),
+}
+
+# What the Pi's H.264 encoder sustains in total: 1080p30 (120x68 macroblocks at 30 fps).
+# That is the Pi 4's documented hardware limit; the Pi 5 has no H.264 hardware and
+# encodes in software, which manages no more.
+ENCODER_MAX_MBPS = 244800
+
+# Process names the streamer may have left running (MediaMTX, or the camera
+# process feeding the built-in server)
+CHILD_NAMES = {b"mediamtx", b"rpicam-vid", b"libcamera-vid"}
+
+# LL-HLS segment and part lengths aimed for (seconds); the actual ones are
+# rounded to whole GOPs and frames, see hls_durations()
+HLS_SEGMENT_TARGET = 1.0
+HLS_PART_TARGET = 0.2
+
+# MediaMTX logs this once the RTSP server is accepting connections
+RTSP_READY_MARKER = "[RTSP] listener opened"
+
+# Config fields that can only take effect by restarting MediaMTX; path
+# settings are patched live through the control API instead
+RESTART_FIELDS = {
+    "port", "api_port", "rtp_port", "write_queue_size", "udp_max_payload_size", "backend",
+    "multicast", "multicast_ip_range", "multicast_rtp_port", "multicast_rtcp_port",
+    "multicast_ttl", "multicast_interface",
+    "webrtc", "webrtc_port", "webrtc_udp_port", "webrtc_tcp_port", "webrtc_hosts",
+    "srt", "srt_port", "hls", "hls_port",
+}
+
+# Stream settings that entries in `streams` inherit from the top level
+STREAM_DEFAULT_FIELDS = (
+    "resolution", "fps", "bitrate", "idr_period", "profile", "level",
+    "on_demand", "on_demand_start_timeout", "on_demand_close_after",
+)
+
+
+@dataclass
+class Substream:
+    """Low-resolution second output encoded from the same camera capture."""
+    path: str
+    resolution: str = "854x480"
+    fps: int = 15
+
+    @property
+    def width(self) -> int:
+        return int(self.resolution.split("x")[0])
+
+    @property
+    def height(self) -> int:
+        return int(self.resolution.split("x")[1])
+
+    @property
+    def macroblocks(self) -> int:
+        """16x16 macroblocks per frame."""
+        return -(-self.width // 16) * -(-self.height // 16)
+
+
+@dataclass
+class Recording:
+    """Continuous recording of every stream into fixed-length segments."""
+    dir: str = "~/recordings"
+    segment_duration: float = 60.0  # Seconds per segment (cut at the next keyframe)
+    max_size_mb: int = 0  # Delete the oldest segments beyond this total (0 = no limit)
+    max_age_hours: float = 0.0  # Delete segments older than this (0 = no limit)
+    preallocate: bool = True  # Reserve each segment's space up front (fallocate)
+
+
+@dataclass
+class MulticastTarget:
+    """Where the built-in server sends multicast RTP."""
+    group: str
+    rtp_port: int
+    rtcp_port: int
+    ttl: int = 1
+    interface: str = ""  # Local IPv4 address to send from ("" = routing table)
+
+
+def _interface_address(interface: str) -> str:
+    """IPv4 address of a network interface given by name (e.g. eth0) or address."""
+    try:
+        return str(ipaddress.IPv4Address(interface))
+    except ValueError:
+        pass
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        # SIOCGIFADDR
+        packed = fcntl.ioctl(sock.fileno(), 0x8915, struct.pack("256s", interface[:15].encode()))
+    return socket.inet_ntoa(packed[20:24])
+
+
+@dataclass
+class StreamDefinition:
+    """One camera path served by MediaMTX."""
+    path: str = "stream"
+    camera: int = 0  # Camera index (0 = first CSI camera)
+    resolution: str = "1536x864"
+    fps: int = 30
+    bitrate: int = 2000000
+    idr_period: int = 5
+    profile: str = "baseline"
+    level: str = "4.1"
+    preset: str = ""  # Name from ENCODER_PRESETS the encoder settings came from
+    on_demand: bool = False
+    on_demand_start_timeout: float = 10.0
+    on_demand_close_after: float = 10.0
+    substream: Optional[Substream] = None
+
+    def __post_init__(self):
+        if isinstance(self.substream, dict):
+            self.substream = Substream(**self.substream) if self.substream else None
+        # Accept 4.1 as a JSON number, and "4" as rpicam-vid spells level 4.0
+        self.level = str(self.level)
+        if self.level == "4":
+            self.level = "4.0"
+
+    @property
+    def width(self) -> int:
+        return int(self.resolution.split("x")[0])
+
+    @property
+    def height(self) -> int:
+        return int(self.resolution.split("x")[1])
+
+    def path_settings(self) -> dict:
+        """MediaMTX path configuration for this stream."""
+        settings = {
+            "source": "rpiCamera",
+            "rpiCameraCamID": self.camera,
+            "rpiCameraWidth": self.width,
+            "rpiCameraHeight": self.height,
+            "rpiCameraFPS": self.fps,
+            "rpiCameraIDRPeriod": self.idr_period,
+            "rpiCameraProfile": self.profile,
+            "rpiCameraLevel": self.level,
+            "rpiCameraBitrate": self.bitrate,
+        }
+        if self.on_demand:
+            settings["sourceOnDemand"] = True
+            settings["sourceOnDemandStartTimeout"] = f"{self.on_demand_start_timeout:g}s"
+            settings["sourceOnDemandCloseAfter"] = f"{self.on_demand_close_after:g}s"
+        if self.substream:
+            settings["rpiCameraSecondaryWidth"] = self.substream.width
+            settings["rpiCameraSecondaryHeight"] = self.substream.height
+            settings["rpiCameraSecondaryFPS"] = self.substream.fps
+        return settings
+
+    @property
+    def macroblocks(self) -> int:
+        """16x16 macroblocks per frame."""
+        return -(-self.width // 16) * -(-self.height // 16)
+
+    def max_bitrate(self, level: Optional[str] = None) -> float:
+        """Highest bitrate (bits/s) `level` (default: the stream's own) allows for its profile."""
+        max_kbps = H264_LEVELS[level or self.level][2]
+        return max_kbps * 1000 * (1.25 if self.profile == "high" else 1)
+
+    def check_level(self) -> None:
+        """Raise ValueError unless the H.264 profile and level can carry this stream."""
+        if self.profile not in H264_PROFILES:
+            raise ValueError(f"'{self.path}': profile must be one of {', '.join(H264_PROFILES)}")
+        if self.level not in H264_LEVELS:
+            raise ValueError(f"'{self.path}': level must be one of {', '.join(H264_LEVELS)}")
+
+        def violation(level: str) -> Optional[str]:
+            max_mbps, max_fs, _ = H264_LEVELS[level]
+            # Frames may not be too large overall, nor too long in either direction
+            max_side = int((8 * max_fs) ** 0.5)
+            if self.macroblocks > max_fs or max(-(-self.width // 16), -(-self.height // 16)) > max_side:
+                return f"{self.resolution} is {self.macroblocks} macroblocks per frame, " \
+                       f"over level {level}'s {max_fs}"
+            if self.macroblocks * self.fps > max_mbps:
+                return f"{self.resolution} @ {self.fps}fps is {self.macroblocks * self.fps} " \
+                       f"macroblocks/s, over level {level}'s {max_mbps}"
+            max_bitrate = self.max_bitrate(level)
+            if self.bitrate > max_bitrate:
+                return f"{self.bitrate / 1e6:g} Mbps is over level {level}'s " \
+                       f"{max_bitrate / 1e6:g} Mbps for {self.profile} profile"
+            return None
+
+        problem = violation(self.level)
+        if problem:
+            fits = [level for level in H264_LEVELS if not violation(level)]
+            if self.macroblocks * self.fps > ENCODER_MAX_MBPS:
+                fits = []  # A level would allow it, but the encoder can't keep up
+            advice = f"use level {fits[0]}" if fits else "the encoder can't sustain this stream"
+            raise ValueError(f"'{self.path}': {problem}; {advice}")
+
+
 @dataclass
 class StreamConfig:
     """RTSP stream configuration."""
@@ -29,6 +282,104 @@ class StreamConfig:
     path: str = "stream"
     bitrate: int = 2000000  # Bitrate in bits per second (default 2 Mbps)
     idr_period: int = 5  # Keyframe interval in frames (lower = faster recovery, more bandwidth)
+    profile: str = "baseline"  # H.264 profile: baseline, main or high (CABAC, fewer bits)
+    level: str = "4.1"  # H.264 level: 4.0, 4.1 or 4.2; checked against resolution, fps, bitrate
+    # Named encoder settings (see ENCODER_PRESETS) that override profile, level,
+    # bitrate and idr_period: "fpv-lowlatency", "surveillance-efficient", "archival"
+    preset: str = ""
+    log_rate: float = 20.0  # Max MediaMTX log lines per second echoed to stdout
+    log_buffer: int = 200  # MediaMTX log lines kept in memory for crash diagnostics
+    api_port: int = 9997  # MediaMTX control API, bound to localhost only
+    wait_for_path: bool = False  # Also wait until the API reports the camera path as ready
+    restart_backoff_max: float = 10.0  # Upper bound on the delay between restart attempts (seconds)
+    crash_loop_limit: int = 5  # Give up after this many crashes within crash_loop_window
+    crash_loop_window: float = 60.0  # Seconds
+    watch_config: bool = True  # Apply edits to the config file without restarting the stream
+    write_queue_size: int = 512  # Packets buffered per reader before it is considered too slow
+    udp_max_payload_size: int = 1472  # Largest RTP packet sent over UDP (fits a 1500 byte MTU)
+    rtp_port: int = 8000  # Server UDP port for RTP to UDP readers (RTCP uses the next one)
+    on_demand: bool = False  # Only run the camera while someone is watching
+    on_demand_start_timeout: float = 10.0  # Seconds to wait for the camera when a reader arrives
+    on_demand_close_after: float = 10.0  # Seconds after the last reader leaves before the camera stops
+    metrics_port: int = 0  # Serve Prometheus metrics on this port (0 = disabled)
+    metrics_interval: float = 5.0  # Seconds between metric collections, however often it is scraped
+    abr: bool = False  # Adapt bitrate/idr_period to what readers actually receive
+    abr_min_bitrate: int = 500000  # Lower bound for the adaptive bitrate
+    abr_max_bitrate: int = 0  # Upper bound (0 = the configured bitrate)
+    abr_min_idr_period: int = 2  # Shortest keyframe interval used while the link is lossy
+    abr_interval: float = 2.0  # Seconds between delivery samples
+    thermal_governor: bool = False  # Step encoder settings down before the SoC throttles
+    thermal_step_down_temp: float = 75.0  # Degrees C at which to step down a level
+    thermal_step_up_temp: float = 65.0  # Degrees C below which to step back up
+    thermal_hold: float = 60.0  # Seconds to stay at a level before stepping back up
+    # Seconds at a level before stepping further down, so the last step can take effect
+    thermal_step_down_hold: float = 20.0
+    thermal_interval: float = 5.0  # Seconds between temperature checks
+    # Levels of {"resolution", "fps", "bitrate"} overrides, mildest first
+    # (empty = DEFAULT_THERMAL_LADDER)
+    thermal_ladder: list = field(default_factory=list)
+    # RTSP server: "mediamtx", "python" (built-in server fed by rpicam-vid, single
+    # stream only) or "auto" (MediaMTX if installed, otherwise the built-in server)
+    backend: str = "auto"
+    # Publish each stream's encoded frames to a shared-memory ring
+    # (/dev/shm/rpi-rtsp-<path>) for local consumers; see FrameBusReader
+    frame_bus: bool = False
+    frame_bus_slots: int = 32  # Frames kept in the ring
+    frame_bus_slot_size: int = 524288  # Largest frame in bytes (bigger ones are skipped)
+    # Keep the last event_pre_roll seconds in memory and save them plus event_post_roll
+    # seconds to event_dir when triggered (SIGUSR1 or POST /event on control_port)
+    event_recording: bool = False
+    event_pre_roll: float = 30.0
+    event_post_roll: float = 60.0
+    event_dir: str = "~/events"
+    control_port: int = 0  # HTTP control endpoint (0 = off)
+    # Serve GET /snapshot.jpg on control_port, decoded from the latest keyframe
+    # at most once per snapshot_ttl seconds (needs ffmpeg)
+    snapshot: bool = False
+    snapshot_ttl: float = 2.0
+    # Let RTSP clients request multicast: each stream is then sent once to a group
+    # from multicast_ip_range, however many multicast viewers there are
+    multicast: bool = False
+    multicast_ip_range: str = "224.1.0.0/16"
+    multicast_rtp_port: int = 8002
+    multicast_rtcp_port: int = 8003
+    multicast_ttl: int = 1  # Router hops (built-in server; MediaMTX always uses 16)
+    multicast_interface: str = ""  # Name or IPv4 address to send from (built-in server)
+    # Serve each path to browsers over WebRTC (WHEP) at http://<pi-ip>:webrtc_port/<path>
+    # (MediaMTX backend only)
+    webrtc: bool = False
+    webrtc_port: int = 8889  # HTTP port for the player page and WHEP signalling
+    webrtc_udp_port: int = 8189  # Single UDP port all WebRTC media flows through
+    webrtc_tcp_port: int = 0  # ICE-TCP fallback for networks that block UDP (0 = off)
+    # ICE host candidates offered to browsers: addresses/hostnames (e.g. the static
+    # IP from configure-ethernet.sh) or interface names. Empty = every interface.
+    webrtc_hosts: list = field(default_factory=list)
+    # Serve each path over SRT (srt://<pi-ip>:srt_port?streamid=read:<path>), which
+    # retransmits lost packets within the latency window (MediaMTX backend only)
+    srt: bool = False
+    srt_port: int = 8890
+    srt_latency: int = 200  # Latency window (ms) for srt_publish_url and printed reader URLs
+    srt_passphrase: str = ""  # AES encryption (10-79 characters); "" = unencrypted
+    srt_pbkeylen: int = 16  # AES key length in bytes when encrypting: 16, 24 or 32
+    # Also push every camera path to this remote SRT listener (caller mode, via
+    # ffmpeg); "{path}" is replaced by the path name, e.g.
+    # "srt://relay.example.com:8890?streamid=publish:{path}"
+    srt_publish_url: str = ""
+    # Serve each path as Low-Latency HLS at http://<pi-ip>:hls_port/<path>/index.m3u8,
+    # muxed in memory; segment and part lengths follow fps and idr_period
+    # (MediaMTX backend only)
+    hls: bool = False
+    hls_port: int = 8888
+    # Optional list of streams (e.g. one per camera); each entry needs a "path" and
+    # "camera" and inherits resolution/fps/bitrate/idr_period from above. When empty,
+    # a single stream is served on `path` from camera 0.
+    streams: list = field(default_factory=list)
+    # Optional low-bandwidth copy of the single stream, e.g.
+    # {"path": "stream_low", "resolution": "854x480", "fps": 15}
+    substream: dict = field(default_factory=dict)
+    # Optional continuous recording, e.g.
+    # {"dir": "/mnt/usb/recordings", "segment_duration": 60, "max_size_mb": 50000}
+    recording: dict = field(default_factory=dict)
 
     @property
     def width(self) -> int:
@@ -42,6 +393,207 @@ class StreamConfig:
     def rtsp_url(self) -> str:
         return f"rtsp://{self.hostname}:{self.port}/{self.path}"
 
+    def stream_definitions(self) -> list:
+        """All streams to serve. Raises ValueError for an inconsistent config."""
+        defaults = {name: getattr(self, name) for name in STREAM_DEFAULT_FIELDS}
+
+        def define(entry: dict) -> StreamDefinition:
+            preset = entry.get("preset", self.preset)
+            if preset and preset not in ENCODER_PRESETS:
+                raise ValueError(f"Unknown preset '{preset}' (choose from {', '.join(ENCODER_PRESETS)})")
+            return StreamDefinition(**{**defaults, **ENCODER_PRESETS.get(preset, {}),
+                                       "preset": preset, **entry})
+
+        try:
+            if not self.streams:
+                definitions = [define({"path": self.path, "substream": self.substream})]
+            else:
+                definitions = [define(entry) for entry in self.streams]
+        except TypeError as e:
+            raise ValueError(f"Invalid stream definition: {e}") from None
+
+        paths: dict = {}
+        cameras: dict = {}
+        for stream in definitions:
+            stream.check_level()
+            # The controller may raise the bitrate up to abr_max_bitrate, so it must fit too
+            if self.abr and self.abr_max_bitrate > stream.max_bitrate():
+                raise ValueError(f"'{stream.path}': abr_max_bitrate {self.abr_max_bitrate / 1e6:g} Mbps "
+                                 f"is over level {stream.level}'s {stream.max_bitrate() / 1e6:g} Mbps "
+                                 f"for {stream.profile} profile")
+            names = [stream.path]
+            if stream.substream:
+                sub = stream.substream
+                if sub.width > stream.width or sub.height > stream.height or sub.fps > stream.fps:
+                    raise ValueError(f"Substream '{sub.path}' must not exceed the resolution "
+                                     f"or fps of '{stream.path}'")
+                names.append(sub.path)
+            for name in names:
+                if name in paths:
+                    raise ValueError(f"Duplicate stream path '{name}'")
+                paths[name] = stream
+            if stream.camera in cameras:
+                raise ValueError(f"Camera {stream.camera} is used by both "
+                                 f"'{cameras[stream.camera]}' and '{stream.path}'")
+            cameras[stream.camera] = stream.path
+
+        # All cameras and substreams share the one hardware encoder
+        encoded = definitions + [stream.substream for stream in definitions if stream.substream]
+        load = sum(stream.macroblocks * stream.fps for stream in encoded)
+        if load > ENCODER_MAX_MBPS:
+            raise ValueError(f"The streams need {load} macroblocks/s together, more than the "
+                             f"encoder's {ENCODER_MAX_MBPS}")
+        return definitions
+
+    def recording_settings(self) -> Optional[Recording]:
+        """The recording section, or None when recording is off. Raises ValueError if invalid."""
+        if not self.recording:
+            return None
+        try:
+            recording = Recording(**self.recording)
+        except TypeError as e:
+            raise ValueError(f"Invalid recording section: {e}") from None
+        if recording.segment_duration < 1:
+            raise ValueError("recording.segment_duration must be at least 1 second")
+        return recording
+
+    def multicast_target(self) -> Optional[MulticastTarget]:
+        """Group and socket options for the built-in server, None when multicast is off.
+
+        Raises ValueError for an invalid range or an unknown interface.
+        """
+        if not self.multicast:
+            return None
+        network = ipaddress.IPv4Network(self.multicast_ip_range, strict=False)
+        if not network.is_multicast:
+            raise ValueError(f"multicast_ip_range {self.multicast_ip_range} is not a multicast range")
+        interface = ""
+        if self.multicast_interface:
+            try:
+                interface = _interface_address(self.multicast_interface)
+            except OSError as e:
+                raise ValueError(f"multicast_interface {self.multicast_interface}: {e}") from None
+        group = network.network_address + 1 if network.num_addresses > 1 else network.network_address
+        return MulticastTarget(str(group), self.multicast_rtp_port, self.multicast_rtcp_port,
+                               self.multicast_ttl, interface)
+
+    def webrtc_settings(self) -> dict:
+        """MediaMTX WebRTC server settings (listeners and ICE host candidates)."""
+        if not self.webrtc:
+            return {"webrtc": False}
+        interfaces = {name for _, name in socket.if_nameindex()}
+        names = [host for host in self.webrtc_hosts if host in interfaces]
+        hosts = [host for host in self.webrtc_hosts if host not in interfaces]
+        return {
+            "webrtc": True,
+            "webrtcAddress": f":{self.webrtc_port}",
+            "webrtcLocalUDPAddress": f":{self.webrtc_udp_port}",
+            "webrtcLocalTCPAddress": f":{self.webrtc_tcp_port}" if self.webrtc_tcp_port else "",
+            # Only the listed hosts/interfaces, so browsers don't try e.g. the WiFi
+            # or docker addresses first and wait for those checks to time out
+            "webrtcIPsFromInterfaces": bool(names) or not hosts,
+            "webrtcIPsFromInterfacesList": names,
+            "webrtcAdditionalHosts": hosts,
+            # Host candidates on the LAN need no STUN/TURN round trips
+            "webrtcICEServers2": [],
+        }
+
+    def srt_settings(self) -> dict:
+        """MediaMTX SRT server settings. Raises ValueError for invalid encryption options."""
+        if not (self.srt or self.srt_publish_url):
+            return {"srt": False}
+        if self.srt_passphrase and not 10 <= len(self.srt_passphrase) <= 79:
+            raise ValueError("srt_passphrase must be 10-79 characters long")
+        if self.srt_pbkeylen not in (16, 24, 32):
+            raise ValueError("srt_pbkeylen must be 16, 24 or 32")
+        if self.srt_latency < 20:
+            raise ValueError("srt_latency must be at least 20 ms")
+        return {"srt": self.srt, "srtAddress": f":{self.srt_port}"}
+
+    def hls_settings(self) -> dict:
+        """MediaMTX LL-HLS settings, with durations derived from the streams' fps and idr_period.
+
+        The durations apply to every path, so all streams must have the same
+        keyframe interval in seconds. Raises ValueError otherwise, or for an
+        inconsistent config.
+        """
+        if not self.hls:
+            return {"hls": False}
+        streams = self.stream_definitions()
+        intervals = {stream.path: Fraction(stream.idr_period, stream.fps) for stream in streams}
+        if len(set(intervals.values())) > 1:
+            listed = ", ".join(f"'{path}' {float(seconds):.3g}s" for path, seconds in intervals.items())
+            raise ValueError(f"With hls on, all streams need the same keyframe interval "
+                             f"(idr_period / fps): {listed}")
+        # Half a frame of the fastest stream is short of a frame boundary in every stream
+        fastest = max(streams, key=lambda stream: stream.fps)
+        segment, part = hls_durations(fastest.fps, fastest.idr_period)
+        return {
+            "hls": True,
+            "hlsAddress": f":{self.hls_port}",
+            "hlsVariant": "lowLatency",
+            "hlsSegmentCount": 7,  # The minimum MediaMTX allows for LL-HLS
+            "hlsSegmentDuration": _go_duration(segment),
+            "hlsPartDuration": _go_duration(part),
+            # Keep segments ready so a cold playlist request doesn't wait for 7 of
+            # them, unless that would keep an on-demand camera running
+            "hlsAlwaysRemux": not self.on_demand,
+            "hlsDirectory": "",  # Segments stay in RAM, never on the SD card
+        }
+
+    def srt_url(self, url: str, streamid: Optional[str] = None) -> str:
+        """`url` with this config's latency and encryption options (ffmpeg's units)."""
+        options = {"streamid": streamid} if streamid else {}
+        options["latency"] = self.srt_latency * 1000  # Microseconds for ffmpeg
+        if self.srt_passphrase:
+            options["passphrase"] = self.srt_passphrase
+            options["pbkeylen"] = self.srt_pbkeylen
+        return url + ("&" if "?" in url else "?") + urllib.parse.urlencode(options, safe=":")
+
+    def degraded(self, stream: StreamDefinition, level: int) -> StreamDefinition:
+        """`stream` with thermal ladder levels 1..`level` applied (0 = unchanged)."""
+        ladder = self.thermal_ladder or DEFAULT_THERMAL_LADDER
+        for step in ladder[:max(0, level)]:
+            changes = {}
+            if "fps" in step:
+                floor = stream.substream.fps if stream.substream else 1
+                changes["fps"] = max(floor, min(stream.fps, step["fps"]))
+            if "bitrate" in step:
+                changes["bitrate"] = min(stream.bitrate, step["bitrate"])
+            if "resolution" in step:
+                width, height = (int(v) for v in step["resolution"].split("x"))
+                smaller = width * height < stream.width * stream.height
+                fits_substream = not stream.substream or (
+                    width >= stream.substream.width and height >= stream.substream.height)
+                if smaller and fits_substream:
+                    changes["resolution"] = step["resolution"]
+            stream = replace(stream, **changes)
+        return stream
+
+    def paths_settings(self) -> dict:
+        """MediaMTX path configuration for every stream, keyed by path name."""
+        settings = {}
+        for stream in self.stream_definitions():
+            settings[stream.path] = stream.path_settings()
+            if stream.substream:
+                # Fed by the secondary output of the camera on the main path
+                settings[stream.substream.path] = {"source": "rpiCameraSecondary"}
+            if self.srt_publish_url:
+                # Copy (no transcode) into MPEG-TS over SRT; MediaMTX restarts it if it exits
+                target = self.srt_url(self.srt_publish_url.replace("{path}", stream.path))
+                settings[stream.path]["runOnReady"] = (
+                    f"ffmpeg -hide_banner -loglevel error -rtsp_transport tcp "
+                    f"-i rtsp://127.0.0.1:{self.port}/{stream.path} -c copy -f mpegts '{target}'")
+                settings[stream.path]["runOnReadyRestart"] = True
+        if self.srt and self.srt_passphrase:
+            for path_settings in settings.values():
+                path_settings["srtReadPassphrase"] = self.srt_passphrase
+        return settings
+
+    def diff(self, other: "StreamConfig") -> set:
+        """Names of the fields whose values differ from `other`."""
+        return {f.name for f in fields(self) if getattr(self, f.name) != getattr(other, f.name)}
+
     def save(self, path: Path) -> None:
         """Save configuration to JSON file."""
         with open(path, "w") as f:
@@ -61,190 +613,3938 @@ class StreamConfig:
         return cls(**data)
 
 
-class RTSPStreamer:
-    """Manages the RTSP streaming using MediaMTX's native Pi camera support."""
+def _yaml_scalar(value) -> str:
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, (int, float)):
+        return str(value)
+    # JSON strings are valid double-quoted YAML scalars
+    return json.dumps(str(value))
 
-    def __init__(self, config: StreamConfig):
-        self.config = config
-        self.mediamtx_proc: Optional[subprocess.Popen] = None
-        self.running = False
 
-    def _find_mediamtx(self) -> Optional[str]:
-        """Find MediaMTX executable."""
-        search_paths = [
-            Path(__file__).parent / "mediamtx",
-            Path("/usr/local/bin/mediamtx"),
-            Path("/usr/bin/mediamtx"),
-            Path.home() / "mediamtx" / "mediamtx",
-        ]
+def _yaml_key(key) -> str:
+    key = str(key)
+    return key if re.fullmatch(r"[A-Za-z0-9_][A-Za-z0-9_.-]*", key) else json.dumps(key)
 
-        for path in search_paths:
-            if path.exists() and os.access(path, os.X_OK):
-                return str(path)
 
-        # Check PATH
+def to_yaml(value, indent: int = 0) -> str:
+    """Render nested dicts/lists of scalars as block-style YAML."""
+    pad = "  " * indent
+    lines = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            key = _yaml_key(key)
+            if isinstance(item, (dict, list)) and item:
+                lines.append(f"{pad}{key}:")
+                lines.append(to_yaml(item, indent + 1))
+            elif isinstance(item, dict):
+                lines.append(f"{pad}{key}: {{}}")
+            elif isinstance(item, list):
+                lines.append(f"{pad}{key}: []")
+            else:
+                lines.append(f"{pad}{key}: {_yaml_scalar(item)}")
+    else:
+        for item in value:
+            if isinstance(item, (dict, list)):
+                nested = to_yaml(item, indent + 1).lstrip()
+                lines.append(f"{pad}- {nested}")
+            else:
+                lines.append(f"{pad}- {_yaml_scalar(item)}")
+    return "\n".join(lines)
+
+
+def hls_durations(fps: int, idr_period: int) -> tuple:
+    """LL-HLS (segment, part) durations in seconds for a stream.
+
+    Segments must start on an IDR frame, so a segment is the smallest whole
+    number of GOPs reaching HLS_SEGMENT_TARGET, and parts evenly divide it
+    into whole frames near HLS_PART_TARGET. MediaMTX cuts at the first
+    frame at or past each duration, so both are set half a frame short to
+    absorb camera timestamp jitter.
+    """
+    segment_frames = idr_period * max(1, -(-round(HLS_SEGMENT_TARGET * fps) // idr_period))
+    target = max(1, round(HLS_PART_TARGET * fps))
+    part_frames = max(n for n in range(1, target + 1) if segment_frames % n == 0)
+    return (segment_frames - 0.5) / fps, (part_frames - 0.5) / fps
+
+
+def _go_duration(seconds: float) -> str:
+    """`seconds` as a Go duration string, e.g. "983.333ms"."""
+    return f"{seconds * 1000:.3f}".rstrip("0").rstrip(".") + "ms"
+
+
+def render_mediamtx_config(config: StreamConfig, paths: Optional[dict] = None) -> str:
+    """Build a complete mediamtx.yml for `config`.
+
+    Everything we don't serve is switched off so MediaMTX doesn't open
+    listeners or allocate buffers for it. `paths` replaces the camera paths
+    (used by the benchmarks).
+    """
+    settings = {
+        "logLevel": "info",
+        "logDestinations": ["stdout"],
+        "writeQueueSize": config.write_queue_size,
+        "udpMaxPayloadSize": config.udp_max_payload_size,
+        "rtpAddress": f":{config.rtp_port}",
+        "rtcpAddress": f":{config.rtp_port + 1}",
+        "api": True,
+        "apiAddress": f"127.0.0.1:{config.api_port}",
+        "metrics": False,
+        "pprof": False,
+        "playback": False,
+        "rtsp": True,
+        "protocols": ["udp", "multicast", "tcp"] if config.multicast else ["udp", "tcp"],
+        "rtspAddress": f":{config.port}",
+        "multicastIPRange": config.multicast_ip_range,
+        "multicastRTPPort": config.multicast_rtp_port,
+        "multicastRTCPPort": config.multicast_rtcp_port,
+        "rtmp": False,
+        **config.hls_settings(),
+        **config.webrtc_settings(),
+        **config.srt_settings(),
+        "paths": config.paths_settings() if paths is None else paths,
+    }
+    return "# Generated by stream.py - edits will be overwritten\n" + to_yaml(settings) + "\n"
+
+
+class LogPump:
+    """Drains MediaMTX output in a background thread so the pipe never fills.
+
+    Every line is kept in a fixed-size ring buffer for crash diagnostics;
+    echoing to stdout is rate limited with a token bucket so log storms
+    (e.g. readers connecting and disconnecting) can't flood the journal.
+    """
+
+    def __init__(self, stream, max_lines: int = 200, rate: float = 20.0, name: str = "mediamtx"):
+        self.stream = stream
+        self.rate = rate
+        self.name = name
+        self.lines: deque = deque(maxlen=max_lines)
+        self.total = 0
+        self.suppressed = 0
+        self._watches: list = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f"{name}-log", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+    def watch(self, marker: str) -> threading.Event:
+        """Return an event that is set the first time a line contains `marker`."""
+        event = threading.Event()
+        with self._lock:
+            if any(marker in line for line in self.lines):
+                event.set()
+            else:
+                self._watches.append((marker, event))
+        return event
+
+    def tail(self, count: Optional[int] = None) -> list:
+        """Return the last `count` lines (all buffered lines by default)."""
+        with self._lock:
+            lines = list(self.lines)
+        return lines if count is None else lines[-count:]
+
+    def _run(self) -> None:
+        tokens = self.rate
+        last = time.monotonic()
         try:
-            result = subprocess.run(
-                ["which", "mediamtx"],
-                capture_output=True,
-                text=True
-            )
-            if result.returncode == 0:
-                return result.stdout.strip()
-        except Exception:
+            for raw in iter(self.stream.readline, b""):
+                line = raw.decode(errors="replace").rstrip()
+                with self._lock:
+                    self.lines.append(line)
+                    self.total += 1
+                    if self._watches:
+                        for marker, event in self._watches:
+                            if marker in line:
+                                event.set()
+                        self._watches = [w for w in self._watches if not w[1].is_set()]
+
+                now = time.monotonic()
+                tokens = min(self.rate, tokens + (now - last) * self.rate)
+                last = now
+                if tokens >= 1:
+                    tokens -= 1
+                    if self.suppressed:
+                        print(f"[{self.name}] ({self.suppressed} lines suppressed)")
+                        self.suppressed = 0
+                    print(f"[{self.name}] {line}")
+                else:
+                    self.suppressed += 1
+        except (OSError, ValueError):
             pass
+        # The child has exited (or closed its output): account for the tail
+        if self.suppressed:
+            print(f"[{self.name}] ({self.suppressed} lines suppressed)")
+            self.suppressed = 0
 
-        return None
 
-    def _is_port_open(self, host: str, port: int) -> bool:
-        """Check if a port is open."""
+class ConfigWatcher:
+    """Calls `on_change` when the config file is modified.
+
+    Uses inotify on the parent directory (editors often replace the file
+    rather than writing in place) and falls back to polling the mtime.
+    """
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+
+    def __init__(self, path: Path, on_change, interval: float = 1.0):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._signature = self._stat_signature()
+        self._thread = threading.Thread(target=self._run, name="config-watch", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _stat_signature(self) -> Optional[tuple]:
         try:
-            with socket.create_connection((host, port), timeout=0.5):
-                return True
-        except Exception:
-            return False
+            st = self.path.stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
 
-    def _wait_for_port(self, host: str, port: int, timeout: float = 10.0) -> bool:
-        """Wait for a port to become available."""
-        deadline = time.time() + timeout
-        while time.time() < deadline:
-            if self._is_port_open(host, port):
-                return True
-            time.sleep(0.2)
-        return False
+    def _check(self) -> None:
+        signature = self._stat_signature()
+        if signature is not None and signature != self._signature:
+            self._signature = signature
+            self.on_change()
 
-    def _kill_existing_processes(self) -> None:
-        """Kill any existing streaming processes."""
+    def _inotify_fd(self) -> Optional[int]:
         try:
-            subprocess.run(
-                ["pkill", "-f", "mediamtx"],
-                capture_output=True,
-                timeout=5
-            )
-        except Exception:
-            pass
-        time.sleep(0.5)
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(fd, str(self.path.parent).encode(), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
 
-    def _start_mediamtx(self) -> bool:
-        """Start MediaMTX with native Pi camera support."""
-        mediamtx_path = self._find_mediamtx()
-        if not mediamtx_path:
-            print("ERROR: MediaMTX not found. Please install it first.")
-            return False
+    def _run(self) -> None:
+        fd = self._inotify_fd()
+        try:
+            while not self._stop.is_set():
+                if fd is None:
+                    self._stop.wait(self.interval)
+                else:
+                    readable, _, _ = select.select([fd], [], [], self.interval)
+                    if not readable:
+                        continue
+                    with contextlib.suppress(BlockingIOError):
+                        while os.read(fd, 4096):
+                            pass
+                    # Let the editor finish writing before reading the file
+                    self._stop.wait(0.2)
+                self._check()
+        finally:
+            if fd is not None:
+                os.close(fd)
 
-        # Configure MediaMTX via environment variables
-        # Using native rpiCamera source
-        env = os.environ.copy()
-        env["MTX_RTSPADDRESS"] = f":{self.config.port}"
-        env["MTX_PATHS_" + self.config.path.upper() + "_SOURCE"] = "rpiCamera"
-        env["MTX_PATHS_" + self.config.path.upper() + "_RPICAMERAWIDTH"] = str(self.config.width)
-        env["MTX_PATHS_" + self.config.path.upper() + "_RPICAMERAHEIGHT"] = str(self.config.height)
-        env["MTX_PATHS_" + self.config.path.upper() + "_RPICAMERAFPS"] = str(self.config.fps)
-        env["MTX_PATHS_" + self.config.path.upper() + "_RPICAMERAIDRPERIOD"] = str(self.config.idr_period)
-        env["MTX_PATHS_" + self.config.path.upper() + "_RPICAMERAPROFILE"] = "baseline"
-        env["MTX_PATHS_" + self.config.path.upper() + "_RPICAMERALEVEL"] = "4.1"
-        env["MTX_PATHS_" + self.config.path.upper() + "_RPICAMERABITRATE"] = str(self.config.bitrate)
 
-        print(f"Starting MediaMTX on port {self.config.port}...")
-        print(f"Resolution: {self.config.resolution}")
-        print(f"FPS: {self.config.fps}")
-        print(f"Bitrate: {self.config.bitrate // 1000000} Mbps")
+@dataclass
+class DeliverySample:
+    """How well readers of a path kept up over one sampling interval.
+
+    Live samples only carry `delivery`: MediaMTX's API has RTCP loss and
+    jitter for sessions it receives from, not for readers. Loss and jitter
+    come from link traces (bench abr).
+    """
+    loss: float = 0.0  # Fraction of RTP packets lost (0-1)
+    jitter: float = 0.0  # Interarrival jitter in seconds (RTP jitter / 90 kHz clock rate)
+    delivery: float = 1.0  # Bytes sent to the reader / bytes produced by the encoder
+
+
+class BitrateController:
+    """Steps the encoder bitrate and keyframe interval to match the link.
+
+    Backs off multiplicatively after a couple of bad samples and probes
+    upwards slowly after a run of clean ones, so the bitrate doesn't
+    oscillate on a noisy link. While readers miss data, whether lost on the
+    link or dropped by the server for a reader that can't keep up, the IDR
+    period is shortened so decoders recover from corruption sooner.
+    """
+
+    LOSS_HIGH = 0.05
+    LOSS_LOW = 0.01
+    JITTER_HIGH = 0.03
+    DELIVERY_LOW = 0.85
+    DELIVERY_OK = 0.95
+    DOWN_AFTER = 2  # Consecutive bad samples before stepping down
+    UP_AFTER = 5  # Consecutive good samples before stepping up
+    DOWN_FACTOR = 0.7
+    UP_FACTOR = 1.15
+
+    def __init__(self, bitrate: int, idr_period: int, min_bitrate: int, max_bitrate: int,
+                 min_idr_period: int):
+        self.min_bitrate = min_bitrate
+        self.max_bitrate = max(max_bitrate, min_bitrate)
+        self.base_idr_period = idr_period
+        self.min_idr_period = min(min_idr_period, idr_period)
+        self.bitrate = min(max(bitrate, self.min_bitrate), self.max_bitrate)
+        self.idr_period = idr_period
+        self._bad = 0
+        self._good = 0
 
+    def update(self, sample: DeliverySample) -> bool:
+        """Feed one sample. Returns True if bitrate or idr_period changed."""
+        bad = (sample.loss > self.LOSS_HIGH or sample.jitter > self.JITTER_HIGH
+               or sample.delivery < self.DELIVERY_LOW)
+        good = sample.loss < self.LOSS_LOW and sample.delivery >= self.DELIVERY_OK
+        self._bad = self._bad + 1 if bad else 0
+        self._good = self._good + 1 if good else 0
+
+        bitrate, idr_period = self.bitrate, self.idr_period
+        if self._bad >= self.DOWN_AFTER:
+            self._bad = 0
+            bitrate = max(self.min_bitrate, int(self.bitrate * self.DOWN_FACTOR))
+            if sample.loss > self.LOSS_HIGH or sample.delivery < self.DELIVERY_LOW:
+                idr_period = max(self.min_idr_period, self.idr_period // 2)
+        elif self._good >= self.UP_AFTER:
+            self._good = 0
+            bitrate = min(self.max_bitrate, int(self.bitrate * self.UP_FACTOR))
+            idr_period = self.base_idr_period
+
+        changed = (bitrate, idr_period) != (self.bitrate, self.idr_period)
+        self.bitrate, self.idr_period = bitrate, idr_period
+        return changed
+
+
+class ThermalGovernor:
+    """Chooses a thermal ladder level from SoC temperature and throttle flags.
+
+    Steps down one level while the SoC is hot or the firmware reports
+    throttling, at most once per `step_down_hold` seconds so each step has
+    time to cool the SoC, and back up one level only after it has been cool
+    for `hold` seconds. `sysfs_root` can point at a fake tree for testing.
+    """
+
+    # get_throttled bits: ARM frequency capped, currently throttled, soft temperature limit
+    THROTTLE_ACTIVE = 0x2 | 0x4 | 0x8
+    THROTTLED_PATH = "sys/devices/platform/soc/soc:firmware/get_throttled"
+
+    def __init__(self, levels: int, step_down_temp: float, step_up_temp: float, hold: float,
+                 step_down_hold: float = 20.0, sysfs_root: Path = Path("/")):
+        self.levels = levels
+        self.step_down_temp = step_down_temp
+        self.step_up_temp = step_up_temp
+        self.hold = hold
+        self.step_down_hold = step_down_hold
+        self.sysfs_root = sysfs_root
+        self.level = 0
+        self.temperature: Optional[float] = None
+        self.throttled: Optional[int] = None
+        self._changed_at: Optional[float] = None
+
+    def read_temperature(self) -> Optional[float]:
+        """Hottest thermal zone in degrees Celsius."""
+        temps = []
+        for zone in self.sysfs_root.glob("sys/class/thermal/thermal_zone*/temp"):
+            try:
+                temps.append(int(zone.read_text()) / 1000)
+            except (OSError, ValueError):
+                continue
+        return max(temps) if temps else None
+
+    def read_throttled(self) -> Optional[int]:
+        """Firmware throttle flags, from sysfs or `vcgencmd get_throttled`."""
         try:
-            self.mediamtx_proc = subprocess.Popen(
-                [mediamtx_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                env=env
-            )
-        except Exception as e:
-            print(f"ERROR: Failed to start MediaMTX: {e}")
-            return False
+            return int((self.sysfs_root / self.THROTTLED_PATH).read_text().strip(), 16)
+        except (OSError, ValueError):
+            pass
+        if self.sysfs_root != Path("/"):
+            return None
+        try:
+            result = subprocess.run(["vcgencmd", "get_throttled"],
+                                    capture_output=True, text=True, timeout=2)
+            return int(result.stdout.strip().split("=")[1], 16)
+        except (OSError, subprocess.SubprocessError, IndexError, ValueError):
+            return None
 
-        # Wait for RTSP port to be available
-        if not self._wait_for_port("127.0.0.1", self.config.port):
-            print("ERROR: MediaMTX failed to start (port not available)")
-            # Print any output for debugging
-            if self.mediamtx_proc.stdout:
-                output = self.mediamtx_proc.stdout.read(4096).decode()
-                if output:
-                    print(f"MediaMTX output: {output}")
-            return False
+    def update(self, now: Optional[float] = None) -> bool:
+        """Re-read the sensors. Returns True if the level changed."""
+        now = time.monotonic() if now is None else now
+        self.temperature = self.read_temperature()
+        self.throttled = self.read_throttled()
+        throttling = bool((self.throttled or 0) & self.THROTTLE_ACTIVE)
+        hot = self.temperature is not None and self.temperature >= self.step_down_temp
+        cool = self.temperature is not None and self.temperature <= self.step_up_temp
 
-        print("MediaMTX started successfully")
+        since_change = float("inf") if self._changed_at is None else now - self._changed_at
+        level = self.level
+        if (hot or throttling) and self.level < self.levels:
+            if since_change >= self.step_down_hold:
+                level += 1
+        elif cool and not throttling and self.level > 0 and since_change >= self.hold:
+            level -= 1
+        if level == self.level:
+            return False
+        self.level = level
+        self._changed_at = now
         return True
 
-    def start(self) -> bool:
-        """Start the RTSP stream."""
-        print("=" * 50)
-        print("RPI-RTSP Streamer")
-        print("=" * 50)
-        print(f"Config: {CONFIG_PATH}")
-        print(f"Resolution: {self.config.resolution}")
-        print(f"FPS: {self.config.fps}")
-        print(f"RTSP URL: rtsp://<pi-ip>:{self.config.port}/{self.config.path}")
-        print("=" * 50)
 
-        self._kill_existing_processes()
+def _read_process_stats(pid: int) -> Optional[tuple]:
+    """(cpu_seconds, rss_bytes) for `pid` from /proc, or None if unavailable."""
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return None
+    # Fields after the parenthesised command name, starting at field 3 (state)
+    values = stat.rsplit(")", 1)[1].split()
+    utime, stime, rss_pages = int(values[11]), int(values[12]), int(values[21])
+    cpu_seconds = (utime + stime) / os.sysconf("SC_CLK_TCK")
+    return cpu_seconds, rss_pages * os.sysconf("SC_PAGE_SIZE")
 
-        if not self._start_mediamtx():
-            return False
 
-        self.running = True
-        print("Stream started successfully!")
-        return True
+def _read_soc_temperature() -> Optional[float]:
+    """SoC temperature in degrees Celsius, or None if unavailable."""
+    try:
+        return int(THERMAL_ZONE_PATH.read_text()) / 1000
+    except (OSError, ValueError):
+        return None
+
+
+class MetricsExporter:
+    """Serves stream health in Prometheus text format.
+
+    Metrics are collected on a fixed interval in a background thread and
+    every scrape is answered from that cached snapshot, so adding scrapers
+    doesn't add load on MediaMTX or the Pi.
+    """
+
+    def __init__(self, streamer: "RTSPStreamer", port: int, interval: float = 5.0):
+        self.streamer = streamer
+        self.port = port
+        self.interval = interval
+        self.body = b""
+        self._stop = threading.Event()
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+
+    def start(self) -> None:
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.body
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.collect()
+        self._server = http.server.ThreadingHTTPServer(("", self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        threading.Thread(target=self._run, name="metrics-collect", daemon=True).start()
 
     def stop(self) -> None:
-        """Stop the stream."""
-        print("\nStopping stream...")
-        self.running = False
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
 
-        if self.mediamtx_proc and self.mediamtx_proc.poll() is None:
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
             try:
-                self.mediamtx_proc.terminate()
-                self.mediamtx_proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self.mediamtx_proc.kill()
-            except Exception:
-                pass
+                self.collect()
+            except Exception as e:
+                print(f"WARNING: Metrics collection failed: {e}")
 
-        print("Stream stopped")
+    @staticmethod
+    def _labels(**labels) -> str:
+        def escape(value) -> str:
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+    def collect(self) -> None:
+        """Take a fresh snapshot of every metric."""
+        streamer = self.streamer
+        metrics: list = []  # (name, type, help, [(labels, value)])
+
+        def add(name, kind, help_text, samples):
+            metrics.append((name, kind, help_text, samples))
+
+        add("rpi_rtsp_restarts_total", "counter", "MediaMTX restarts by the supervisor",
+            [("", streamer.restart_count)])
+        add("rpi_rtsp_outage_seconds_total", "counter", "Time spent restarting MediaMTX",
+            [("", streamer.total_outage)])
+        if streamer.time_to_ready is not None:
+            add("rpi_rtsp_time_to_ready_seconds", "gauge",
+                "Time from launching MediaMTX until RTSP was ready, last start",
+                [("", streamer.time_to_ready)])
+
+        proc = streamer.child_proc
+        up = proc is not None and proc.poll() is None
+        add("rpi_rtsp_up", "gauge", "Whether MediaMTX is running", [("", int(up))])
+        add("rpi_rtsp_thermal_level", "gauge", "Thermal ladder level in use (0 = full quality)",
+            [("", streamer._applied_thermal_level)])
+        stats = _read_process_stats(proc.pid) if up else None
+        if stats:
+            add("rpi_rtsp_mediamtx_cpu_seconds_total", "counter", "MediaMTX CPU time",
+                [("", stats[0])])
+            add("rpi_rtsp_mediamtx_resident_memory_bytes", "gauge", "MediaMTX resident memory",
+                [("", stats[1])])
+
+        temperature = _read_soc_temperature()
+        if temperature is not None:
+            add("rpi_rtsp_soc_temperature_celsius", "gauge", "SoC temperature",
+                [("", temperature)])
+
+        paths = streamer._api_request("GET", "/v3/paths/list") if up else None
+        if paths is not None:
+            items = paths.get("items", [])
+            add("rpi_rtsp_path_ready", "gauge", "Whether the path has an active source",
+                [(self._labels(path=p.get("name")), int(bool(p.get("ready")))) for p in items])
+            add("rpi_rtsp_path_readers", "gauge", "Readers connected to the path",
+                [(self._labels(path=p.get("name")), len(p.get("readers") or [])) for p in items])
+            add("rpi_rtsp_path_bytes_received_total", "counter", "Bytes received from the source",
+                [(self._labels(path=p.get("name")), p.get("bytesReceived", 0)) for p in items])
+
+        sessions = streamer._api_request("GET", "/v3/rtspsessions/list") if up else None
+        if sessions is not None:
+            samples = [
+                (self._labels(session=item.get("id"), path=item.get("path", ""),
+                              remote=item.get("remoteAddr", "")), item.get("bytesSent", 0))
+                for item in sessions.get("items", [])
+            ]
+            add("rpi_rtsp_session_bytes_sent_total", "counter", "Bytes sent to an RTSP session",
+                samples)
+
+        lines = []
+        for name, kind, help_text, samples in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+        self.body = ("\n".join(lines) + "\n").encode()
+
+
+@dataclass
+class Frame:
+    """One access unit read from a frame bus."""
+    seq: int
+    timestamp_ns: int  # time.time_ns() when the frame was published
+    keyframe: bool
+    data: object  # Annex B bytes, or a memoryview into the bus for copy=False reads
+
+
+class FrameBusWriter:
+    """Publishes encoded frames into a POSIX shared-memory ring for local consumers.
 
-    def wait(self) -> None:
-        """Wait for the streaming process to end."""
+    Layout: a 64-byte header (magic, version, slot count, slot size, then the
+    count of published frames at offset 16) followed by fixed-size slots. Each
+    slot starts with a sequence word, timestamp, length and flags. The single
+    writer makes the slot's sequence word odd while it copies a frame in and
+    sets it to 2 * (frame number + 1) when done, so readers detect torn or
+    overwritten slots without locks (a seqlock per slot).
+    """
+
+    MAGIC = b"RPFB"
+    VERSION = 1
+    HEADER = struct.Struct("<4sIII")  # magic, version, slots, slot_size
+    COUNT_OFFSET = 16
+    HEADER_SIZE = 64
+    SLOT_HEADER = struct.Struct("<QQII")  # seq word, timestamp_ns, length, flags
+    SLOT_HEADER_SIZE = 32
+    KEYFRAME = 0x1
+
+    def __init__(self, name: str, slots: int = 32, slot_size: int = 512 * 1024):
+        from multiprocessing import shared_memory
+
+        self.name = name
+        self.slots = slots
+        self.slot_size = slot_size
+        self.published = 0
+        self.dropped = 0  # Frames larger than a slot
+        self._lock = threading.Lock()  # Keeps close() from racing a publish
+        size = self.HEADER_SIZE + slots * (self.SLOT_HEADER_SIZE + slot_size)
         try:
-            while self.running:
-                if self.mediamtx_proc and self.mediamtx_proc.poll() is not None:
-                    print("MediaMTX process ended unexpectedly")
-                    break
-                time.sleep(1)
-        except KeyboardInterrupt:
-            pass
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a previous run that didn't shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.buf = self.shm.buf
+        self.HEADER.pack_into(self.buf, 0, self.MAGIC, self.VERSION, slots, slot_size)
+        struct.pack_into("<Q", self.buf, self.COUNT_OFFSET, 0)
 
+    def publish(self, nals: list, keyframe: bool, timestamp_ns: Optional[int] = None) -> bool:
+        """Write one access unit (NAL units without start codes) as Annex B."""
+        length = sum(4 + len(nal) for nal in nals)
+        if length > self.slot_size:
+            self.dropped += 1
+            return False
+        with self._lock:
+            if self.buf is None:
+                return False
+            self._write(nals, keyframe, timestamp_ns, length)
+        return True
 
-def main():
-    # Load configuration
-    config = StreamConfig.load(CONFIG_PATH)
+    def _write(self, nals: list, keyframe: bool, timestamp_ns: Optional[int], length: int) -> None:
+        n = self.published
+        offset = self.HEADER_SIZE + (n % self.slots) * (self.SLOT_HEADER_SIZE + self.slot_size)
+        buf = self.buf
+        struct.pack_into("<Q", buf, offset, 2 * n + 1)
+        pos = offset + self.SLOT_HEADER_SIZE
+        for nal in nals:
+            buf[pos:pos + 4] = b"\x00\x00\x00\x01"
+            buf[pos + 4:pos + 4 + len(nal)] = nal
+            pos += 4 + len(nal)
+        self.SLOT_HEADER.pack_into(
+            buf, offset, 2 * n + 1, timestamp_ns or time.time_ns(), length,
+            self.KEYFRAME if keyframe else 0)
+        struct.pack_into("<Q", buf, offset, 2 * n + 2)
+        self.published = n + 1
+        struct.pack_into("<Q", buf, self.COUNT_OFFSET, n + 1)
 
-    # Create streamer
-    streamer = RTSPStreamer(config)
+    def close(self) -> None:
+        with self._lock:
+            self.buf = None
+        self.shm.close()
+        with contextlib.suppress(FileNotFoundError):
+            self.shm.unlink()
 
-    # Set up signal handlers for graceful shutdown
-    def signal_handler(sig, frame):
-        streamer.stop()
-        sys.exit(0)
 
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+class FrameBusReader:
+    """Reads frames published by a FrameBusWriter, from any local process.
 
-    # Start streaming
-    if not streamer.start():
-        print("Failed to start streaming")
-        sys.exit(1)
+    >>> bus = FrameBusReader("rpi-rtsp-stream")
+    >>> frame = bus.read(timeout=1.0)  # Next Annex B access unit, or None
 
-    # Wait for stream to end
-    streamer.wait()
-    streamer.stop()
+    A reader that falls more than a ring behind skips ahead (counted in
+    `skipped`). With copy=False the frame data is a view into the ring; call
+    `valid(frame)` after using it to check it wasn't overwritten meanwhile,
+    and drop the view before close().
+    """
+
+    def __init__(self, name: str, poll_interval: float = 0.0002):
+        from multiprocessing import shared_memory
+
+        try:
+            self.shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Python < 3.13 would unlink the writer's segment when this process exits
+            from multiprocessing import resource_tracker
+
+            self.shm = shared_memory.SharedMemory(name)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.buf = self.shm.buf
+        magic, version, self.slots, self.slot_size = FrameBusWriter.HEADER.unpack_from(self.buf, 0)
+        if magic != FrameBusWriter.MAGIC or version != FrameBusWriter.VERSION:
+            self.close()
+            raise ValueError(f"{name} is not a frame bus")
+        self.poll_interval = poll_interval
+        self.skipped = 0
+        self.next = self._count()  # Start with the next frame published
+
+    def _count(self) -> int:
+        return struct.unpack_from("<Q", self.buf, FrameBusWriter.COUNT_OFFSET)[0]
+
+    def _offset(self, n: int) -> int:
+        return FrameBusWriter.HEADER_SIZE + (n % self.slots) * (
+            FrameBusWriter.SLOT_HEADER_SIZE + self.slot_size)
+
+    def read(self, timeout: Optional[float] = None, copy: bool = True) -> Optional[Frame]:
+        """Return the next frame, waiting up to `timeout` seconds (forever if None)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            count = self._count()
+            if self.next < count:
+                if count - self.next >= self.slots:
+                    # Lapped by the writer: the oldest slots are being reused
+                    self.skipped += count - self.next - 1
+                    self.next = count - 1
+                n = self.next
+                offset = self._offset(n)
+                seq, timestamp, length, flags = FrameBusWriter.SLOT_HEADER.unpack_from(self.buf, offset)
+                start = offset + FrameBusWriter.SLOT_HEADER_SIZE
+                data = self.buf[start:start + length]
+                if copy:
+                    data = bytes(data)
+                if seq == 2 * n + 2 and struct.unpack_from("<Q", self.buf, offset)[0] == seq:
+                    self.next = n + 1
+                    return Frame(n, timestamp, bool(flags & FrameBusWriter.KEYFRAME), data)
+                if isinstance(data, memoryview):
+                    data.release()
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def valid(self, frame: Frame) -> bool:
+        """Whether a frame read with copy=False is still intact in the ring."""
+        seq = struct.unpack_from("<Q", self.buf, self._offset(frame.seq))[0]
+        return seq == 2 * frame.seq + 2
+
+    def close(self) -> None:
+        self.buf = None
+        self.shm.close()
+
+
+def frame_bus_name(path: str) -> str:
+    """Shared-memory name of a stream path's frame bus (/dev/shm/<name>)."""
+    return "rpi-rtsp-" + path.replace("/", "_")
+
+
+class FrameTap:
+    """Reads a MediaMTX path over loopback RTSP and hands each frame to `on_frame`.
+
+    One tap per path feeds the frame bus and the event recorder. It counts
+    as a reader, so with on_demand the camera stays on while the tap runs.
+    """
+
+    def __init__(self, url: str, on_frame):
+        self.url = url
+        self.on_frame = on_frame  # Called with (nals, keyframe)
+        self._stop = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread = threading.Thread(target=self._run, name="frame-tap", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._loop and self._task:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        with contextlib.suppress(asyncio.CancelledError):
+            asyncio.run(self._main())
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.current_task()
+        while not self._stop.is_set():
+            client = RTSPClient(self.url)
+            try:
+                await client.connect()
+                await client.play("tcp")
+                depacketizer = H264Depacketizer(sdp_parameter_sets(client.sdp))
+                while True:
+                    for nals, keyframe in depacketizer.push(await client.read_rtp()):
+                        self.on_frame(nals, keyframe)
+            except (OSError, ConnectionError, ValueError, asyncio.IncompleteReadError):
+                pass  # MediaMTX restarting or the camera not up yet
+            finally:
+                await client.close()
+            await asyncio.sleep(1)
+
+
+def _crc32_mpeg(data: bytes) -> int:
+    """CRC-32/MPEG-2, as used by PSI sections."""
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        crc &= 0xFFFFFFFF
+    return crc
+
+
+class TSMuxer:
+    """Minimal MPEG-TS muxer for one H.264 stream (PAT/PMT, PES with PTS, PCR)."""
+
+    PMT_PID = 0x1000
+    VIDEO_PID = 0x100
+
+    def __init__(self):
+        self.continuity: dict = {}
+        pat = struct.pack("!HBBBHH", 1, 0xC1, 0, 0, 1, 0xE000 | self.PMT_PID)
+        pmt = struct.pack("!HBBBHHBHH", 1, 0xC1, 0, 0, 0xE000 | self.VIDEO_PID, 0xF000,
+                          0x1B, 0xE000 | self.VIDEO_PID, 0xF000)
+        self._pat = self._section(0x00, pat)
+        self._pmt = self._section(0x02, pmt)
+
+    @staticmethod
+    def _section(table_id: int, body: bytes) -> bytes:
+        section = struct.pack("!BH", table_id, 0xB000 | (len(body) + 4)) + body
+        return section + struct.pack("!I", _crc32_mpeg(section))
+
+    def _header(self, pid: int, unit_start: bool, adaptation: bool) -> bytes:
+        cc = self.continuity.get(pid, 0)
+        self.continuity[pid] = (cc + 1) & 0x0F
+        return struct.pack("!BHB", 0x47, (0x4000 if unit_start else 0) | pid,
+                           (0x30 if adaptation else 0x10) | cc)
+
+    def psi(self) -> bytes:
+        """PAT and PMT packets; repeated before every keyframe so files can be cut anywhere."""
+        out = bytearray()
+        for pid, section in ((0, self._pat), (self.PMT_PID, self._pmt)):
+            payload = b"\x00" + section
+            out += self._header(pid, True, False) + payload + b"\xff" * (184 - len(payload))
+        return bytes(out)
+
+    def frame(self, data: bytes, pts: int, keyframe: bool) -> bytes:
+        """TS packets for one Annex B access unit; `pts` is on the 90 kHz clock."""
+        pts &= (1 << 33) - 1
+        pes = bytes([0, 0, 1, 0xE0, 0, 0, 0x80, 0x80, 5,
+                     0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, ((pts >> 14) & 0xFE) | 1,
+                     (pts >> 7) & 0xFF, ((pts << 1) & 0xFE) | 1])
+        # An access unit delimiter opens every frame
+        payload = memoryview(pes + b"\x00\x00\x00\x01\x09\xf0" + data)
+        out = bytearray(self.psi() if keyframe else b"")
+        pcr = max(0, pts - 4500)  # Clock reference 50 ms ahead of presentation
+        pos = 0
+        while pos < len(payload):
+            adaptation = None
+            if pos == 0:
+                adaptation = bytes([0x50 if keyframe else 0x10]) + struct.pack(
+                    "!IH", pcr >> 1, ((pcr & 1) << 15) | 0x7E00)
+            room = 184 - (len(adaptation) + 1 if adaptation is not None else 0)
+            chunk = payload[pos:pos + room]
+            stuffing = room - len(chunk)
+            if stuffing:
+                if adaptation is None:
+                    adaptation = b"" if stuffing == 1 else b"\x00" + b"\xff" * (stuffing - 2)
+                else:
+                    adaptation += b"\xff" * stuffing
+            out += self._header(self.VIDEO_PID, pos == 0, adaptation is not None)
+            if adaptation is not None:
+                out += bytes([len(adaptation)]) + adaptation
+            out += chunk
+            pos += len(chunk)
+        return bytes(out)
+
+
+class EventRecorder:
+    """Keeps the last `pre_roll` seconds of a stream in memory and records events to MPEG-TS.
+
+    The ring holds whole GOPs, so the pre-roll always starts on an IDR frame
+    (up to one `idr_period` more than `pre_roll`). trigger() writes the
+    pre-roll followed by `post_roll` seconds of live frames from a writer
+    thread, as one sequential, append-only file; triggering again while
+    recording extends the same file.
+    """
+
+    def __init__(self, path: str, directory: Path, pre_roll: float, post_roll: float):
+        self.path = path
+        self.directory = directory
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.gops: deque = deque()  # [(timestamp_ns, annex_b, keyframe), ...] per GOP
+        self.recording: Optional[Path] = None
+        self.recording_until = 0.0
+        self._queue: Optional[deque] = None
+        self._wake = threading.Condition()
+
+    def push(self, nals: list, keyframe: bool, timestamp_ns: Optional[int] = None) -> None:
+        timestamp_ns = timestamp_ns or time.time_ns()
+        frame = (timestamp_ns,
+                 b"".join(itertools.chain.from_iterable((b"\x00\x00\x00\x01", nal) for nal in nals)),
+                 keyframe)
+        with self._wake:
+            if keyframe:
+                self.gops.append([frame])
+                # Drop GOPs while the next one still covers the pre-roll
+                while len(self.gops) > 1 and timestamp_ns - self.gops[1][0][0] >= self.pre_roll * 1e9:
+                    self.gops.popleft()
+            elif self.gops:
+                self.gops[-1].append(frame)
+            if self._queue is not None:
+                self._queue.append(frame)
+                self._wake.notify()
+
+    def trigger(self) -> Path:
+        """Start (or extend) an event recording; returns the file it goes to."""
+        with self._wake:
+            self.recording_until = time.monotonic() + self.post_roll
+            if self.recording:
+                return self.recording
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            self.recording = self.directory / f"{self.path.replace('/', '_')}-{stamp}.ts"
+            self._queue = deque(itertools.chain.from_iterable(self.gops))
+            threading.Thread(target=self._write, args=(self.recording, self._queue),
+                             name="event-writer", daemon=True).start()
+            return self.recording
+
+    def _write(self, target: Path, frames: deque) -> None:
+        muxer = TSMuxer()
+        partial = target.with_suffix(".ts.part")
+        written, first, last = 0, None, None
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(partial, "wb", buffering=1 << 20) as f:
+                while True:
+                    with self._wake:
+                        while not frames and time.monotonic() < self.recording_until:
+                            self._wake.wait(0.5)
+                        if not frames:
+                            self._queue = None
+                            self.recording = None
+                            break
+                        timestamp_ns, data, keyframe = frames.popleft()
+                    if first is None:
+                        if not keyframe:
+                            continue  # Players need an IDR (with SPS/PPS) first
+                        first = timestamp_ns
+                    pts = 90000 + (timestamp_ns - first) * 9 // 100000
+                    f.write(muxer.frame(data, pts, keyframe))
+                    written += 1
+                    last = timestamp_ns
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(partial, target)
+        except OSError as e:
+            with self._wake:
+                self._queue = None
+                self.recording = None
+            print(f"ERROR: Event recording {target} failed: {e}")
+            return
+        duration = (last - first) / 1e9 if written else 0.0
+        print(f"Event recording saved: {target} ({duration:.1f}s, {written} frames)")
+
+
+class SegmentIndex:
+    """Finished recording segments, oldest first, with their total size.
+
+    Built from one directory scan at startup and kept up to date as segments
+    are closed, so retention deletes the oldest segments in O(1) each
+    without rescanning the directory.
+    """
+
+    def __init__(self, directory: Path, max_size: int = 0, max_age: float = 0.0):
+        self.directory = directory
+        self.max_size = max_size  # Bytes (0 = unlimited)
+        self.max_age = max_age  # Seconds (0 = unlimited)
+        self.segments: deque = deque()  # (mtime, size, path)
+        self.total = 0
+        self._lock = threading.Lock()
+        found = []
+        for path in directory.glob("*/*.ts"):
+            with contextlib.suppress(OSError):
+                st = path.stat()
+                found.append((st.st_mtime, st.st_size, path))
+        for entry in sorted(found):
+            self.segments.append(entry)
+            self.total += entry[1]
+
+    def add(self, path: Path, size: int) -> None:
+        with self._lock:
+            self.segments.append((time.time(), size, path))
+            self.total += size
+
+    def sweep(self) -> None:
+        """Delete the oldest segments until the size and age limits hold."""
+        now = time.time()
+        while True:
+            with self._lock:
+                if not self.segments:
+                    return
+                mtime, size, path = self.segments[0]
+                if not ((self.max_size and self.total > self.max_size)
+                        or (self.max_age and now - mtime > self.max_age)):
+                    return
+                self.segments.popleft()
+                self.total -= size
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+
+
+class SegmentRecorder:
+    """Records one stream continuously into MPEG-TS segments of `segment_duration` seconds.
+
+    Segments start on keyframes. Frames are muxed and written by a writer
+    thread, in chunks that are whole TS packets and whole 4 KiB pages, to
+    files preallocated for the expected segment size.
+    """
+
+    # 47 pages of 4 KiB = 1024 TS packets of 188 bytes
+    CHUNK = 47 * 4096 * 5
+    MAX_QUEUED = 300  # Frames buffered while the card is slow, then frames are dropped
+    FALLOC_FL_KEEP_SIZE = 0x01
+
+    def __init__(self, path: str, index: SegmentIndex, segment_duration: float,
+                 bitrate: int, preallocate: bool = True):
+        self.path = path
+        self.index = index
+        self.segment_duration = segment_duration
+        self.bitrate = bitrate
+        self.preallocate = preallocate
+        self.dropped = 0
+        self._frames: deque = deque()
+        self._wake = threading.Condition()
+        self._stop = False
+        self._fallocate = self._libc_fallocate() if preallocate else None
+        self._thread = threading.Thread(target=self._run, name="segment-writer", daemon=True)
+
+    @staticmethod
+    def _libc_fallocate():
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            # fallocate64 takes 64-bit offsets on 32-bit Pi OS too
+            fallocate = getattr(libc, "fallocate64", None) or libc.fallocate
+        except (OSError, AttributeError):
+            return None
+        fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+        return fallocate
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Finish the current segment and stop."""
+        with self._wake:
+            self._stop = True
+            self._wake.notify()
+        self._thread.join(timeout=10)
+
+    def push(self, nals: list, keyframe: bool, timestamp_ns: Optional[int] = None) -> None:
+        frame = (timestamp_ns or time.time_ns(),
+                 b"".join(itertools.chain.from_iterable((b"\x00\x00\x00\x01", nal) for nal in nals)),
+                 keyframe)
+        with self._wake:
+            if len(self._frames) >= self.MAX_QUEUED:
+                self.dropped += 1
+                return
+            self._frames.append(frame)
+            self._wake.notify()
+
+    def _open(self) -> tuple:
+        directory = self.index.directory / self.path.replace("/", "_")
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / (time.strftime("%Y-%m-%d_%H-%M-%S") + ".ts")
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o644)
+        if self._fallocate:
+            # Reserve the blocks up front so the segment stays contiguous on the card
+            expected = int(self.bitrate / 8 * self.segment_duration * 1.1)
+            if self._fallocate(fd, self.FALLOC_FL_KEEP_SIZE, 0, expected) != 0:
+                self._fallocate = None  # Unsupported here (e.g. vfat)
+        return target, fd
+
+    def _close(self, target: Path, fd: int, pending: bytearray, size: int) -> None:
+        if pending:
+            os.write(fd, pending)
+        # Give back preallocated blocks past the end
+        os.ftruncate(fd, size)
+        os.fsync(fd)
+        os.close(fd)
+        self.index.add(target, size)
+        self.index.sweep()
+
+    def _run(self) -> None:
+        target, fd, muxer = None, None, None
+        pending = bytearray()
+        size = 0
+        started = 0
+        while True:
+            with self._wake:
+                while not self._frames and not self._stop:
+                    self._wake.wait()
+                if not self._frames:
+                    break
+                timestamp_ns, data, keyframe = self._frames.popleft()
+            try:
+                if keyframe and (fd is None or timestamp_ns - started >= self.segment_duration * 1e9):
+                    if fd is not None:
+                        self._close(target, fd, pending, size)
+                    target, fd = self._open()
+                    muxer, pending, size, started = TSMuxer(), bytearray(), 0, timestamp_ns
+                if fd is None:
+                    continue  # Wait for the first keyframe
+                packets = muxer.frame(data, 90000 + (timestamp_ns - started) * 9 // 100000, keyframe)
+                pending += packets
+                size += len(packets)
+                if len(pending) >= self.CHUNK:
+                    view = memoryview(pending)
+                    whole = len(pending) - len(pending) % self.CHUNK
+                    os.write(fd, view[:whole])
+                    view.release()
+                    del pending[:whole]
+            except OSError as e:
+                print(f"ERROR: Recording '{self.path}' to {target} failed: {e}")
+                if fd is not None:
+                    with contextlib.suppress(OSError):
+                        os.close(fd)
+                target, fd = None, None
+                time.sleep(1)
+        if fd is not None:
+            with contextlib.suppress(OSError):
+                self._close(target, fd, pending, size)
+
+
+class SnapshotCache:
+    """Latest keyframe of a stream and a JPEG of it, decoded on demand.
+
+    The JPEG is refreshed from the newest IDR frame only when it is
+    requested and older than `ttl`, and only one decode runs at a time:
+    concurrent pollers wait for it and share the result.
+
+    With a `tap_url`, nothing else reads the path, so the cache opens its own
+    FrameTap when a stale snapshot is requested and closes it once no
+    request has come for `ttl` seconds; an on_demand camera can then stop.
+    """
+
+    def __init__(self, path: str, ttl: float, ffmpeg: Optional[str],
+                 tap_url: Optional[str] = None, start_timeout: float = 10.0):
+        self.path = path
+        self.ttl = ttl
+        self.ffmpeg = ffmpeg
+        self.tap_url = tap_url
+        self.start_timeout = start_timeout  # How long a request waits for the tap's first keyframe
+        self.decodes = 0
+        self._keyframe: Optional[bytes] = None
+        self._keyframe_seq = 0
+        self._new_keyframe = threading.Event()
+        self._jpeg: Optional[bytes] = None
+        self._jpeg_seq = -1
+        self._jpeg_time = 0.0
+        self._refresh = threading.Lock()
+        self._tap: Optional[FrameTap] = None
+        self._close_timer: Optional[threading.Timer] = None
+        self._last_request = 0.0
+
+    def push(self, nals: list, keyframe: bool) -> None:
+        if keyframe:
+            self._keyframe = b"".join(
+                itertools.chain.from_iterable((b"\x00\x00\x00\x01", nal) for nal in nals))
+            self._keyframe_seq += 1
+            self._new_keyframe.set()
+
+    def set_tap_url(self, url: Optional[str]) -> None:
+        """Read the path itself from `url` while requested, or not at all (None)."""
+        with self._refresh:
+            if url != self.tap_url:
+                self._close_tap()
+                self.tap_url = url
+
+    def close(self) -> None:
+        with self._refresh:
+            self._close_tap()
+
+    def _close_tap(self) -> None:
+        if self._close_timer:
+            self._close_timer.cancel()
+            self._close_timer = None
+        if self._tap:
+            self._tap.stop()
+            self._tap = None
+
+    def _close_when_idle(self) -> None:
+        with self._refresh:
+            idle = time.monotonic() - self._last_request
+            if self._tap is None:
+                return
+            if idle >= self.ttl:
+                self._close_timer = None
+                self._close_tap()
+                return
+            self._schedule_close(self.ttl - idle)
+
+    def _schedule_close(self, delay: float) -> None:
+        self._close_timer = threading.Timer(delay, self._close_when_idle)
+        self._close_timer.daemon = True
+        self._close_timer.start()
+
+    def get(self) -> Optional[bytes]:
+        """A JPEG no older than `ttl` (or the newest possible), None if there is none yet."""
+        self._last_request = time.monotonic()
+        if self._jpeg and time.monotonic() - self._jpeg_time < self.ttl:
+            return self._jpeg
+        with self._refresh:
+            # Someone else may have refreshed it while we waited
+            if self._jpeg and time.monotonic() - self._jpeg_time < self.ttl:
+                return self._jpeg
+            if self.tap_url and self._tap is None:
+                # The cached keyframe is from the last time the tap ran: wait for a new one
+                self._new_keyframe.clear()
+                self._tap = FrameTap(self.tap_url, self.push)
+                self._tap.start()
+                self._schedule_close(self.ttl)
+                self._new_keyframe.wait(self.start_timeout)
+            keyframe, seq = self._keyframe, self._keyframe_seq
+            if keyframe is not None and seq != self._jpeg_seq:
+                jpeg = self._decode(keyframe)
+                if jpeg:
+                    self._jpeg, self._jpeg_seq = jpeg, seq
+            self._jpeg_time = time.monotonic()
+            return self._jpeg
+
+    def _decode(self, keyframe: bytes) -> Optional[bytes]:
+        self.decodes += 1
+        try:
+            result = subprocess.run(
+                [self.ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "h264", "-i", "pipe:",
+                 "-frames:v", "1", "-q:v", "4", "-f", "image2pipe", "-c:v", "mjpeg", "pipe:"],
+                input=keyframe, capture_output=True, timeout=5)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"WARNING: Snapshot of '{self.path}' failed: {e}")
+            return None
+        if result.returncode != 0 or not result.stdout:
+            print(f"WARNING: Snapshot of '{self.path}' failed: "
+                  f"{result.stderr.decode(errors='replace').strip()}")
+            return None
+        return result.stdout
+
+
+class ControlServer:
+    """Small HTTP endpoint for actions on the running stream.
+
+    POST /event[?path=<path>] starts an event recording on one or all paths.
+    GET /snapshot.jpg[?path=<path>] returns a still of a path (default: the first).
+    """
+
+    def __init__(self, streamer: "RTSPStreamer", port: int):
+        self.streamer = streamer
+        self.port = port
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+
+    def start(self) -> None:
+        streamer = self.streamer
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def _send(self, status: int, content_type: str, body: bytes,
+                      headers: Optional[dict] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                with contextlib.suppress(BrokenPipeError, ConnectionResetError):
+                    self.wfile.write(body)
+
+            def _reply(self, status: int, payload: dict) -> None:
+                self._send(status, "application/json", json.dumps(payload).encode())
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                if url.path != "/snapshot.jpg":
+                    self._reply(404, {"error": "not found"})
+                    return
+                if not streamer.snapshots:
+                    self._reply(503, {"error": "snapshots are disabled"})
+                    return
+                path = urllib.parse.parse_qs(url.query).get("path", [None])[0]
+                cache = streamer.snapshots.get(path or next(iter(streamer.snapshots)))
+                if cache is None:
+                    self._reply(404, {"error": f"unknown path '{path}'"})
+                    return
+                if not cache.ffmpeg:
+                    self._reply(503, {"error": "ffmpeg is needed for snapshots"})
+                    return
+                jpeg = cache.get()
+                if jpeg is None:
+                    self._reply(503, {"error": "no keyframe received yet"})
+                    return
+                self._send(200, "image/jpeg", jpeg, {"Cache-Control": f"max-age={int(cache.ttl)}"})
+
+            def do_POST(self):
+                url = urllib.parse.urlsplit(self.path)
+                if url.path != "/event":
+                    self._reply(404, {"error": "not found"})
+                    return
+                path = urllib.parse.parse_qs(url.query).get("path", [None])[0]
+                if not streamer.event_recorders:
+                    self._reply(503, {"error": "event recording is disabled"})
+                    return
+                if path is not None and path not in streamer.event_recorders:
+                    self._reply(404, {"error": f"unknown path '{path}'"})
+                    return
+                files = streamer.trigger_event(path)
+                self._reply(202, {"recordings": [str(f) for f in files]})
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(http.server.ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 128  # Dashboards poll snapshots in bursts
+
+        self._server = Server(("", self.port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="control-http", daemon=True).start()
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class _RTSPSession:
+    """A reader of the built-in server's stream."""
+
+    def __init__(self, session_id: str, writer: asyncio.StreamWriter):
+        self.id = session_id
+        self.writer = writer
+        self.transport = "tcp"
+        self.channel = 0
+        self.udp_address: Optional[tuple] = None
+        self.playing = False
+        self.waiting_for_keyframe = True
+        self.dropped = 0
+
+
+class H264RTSPServer:
+    """Built-in asyncio RTSP server for one H.264 stream, used when MediaMTX isn't available.
+
+    Reads an Annex B byte stream (rpicam-vid --inline -o -), packetizes each
+    NAL unit once into RTP (RFC 6184) and fans the same packet buffers out to
+    every playing session: RTP over the RTSP connection (interleaved), UDP
+    unicast or, with `multicast`, a single copy to a multicast group shared by
+    all multicast sessions. Supports OPTIONS, DESCRIBE, SETUP, PLAY, TEARDOWN and keepalive
+    GET_PARAMETER/SET_PARAMETER.
+
+    A NAL unit is only complete once the next start code arrives, so frames
+    leave about one frame interval later than with MediaMTX.
+    """
+
+    MTU = 1400
+    READ_SIZE = 65536
+
+    def __init__(self, source, path: str, port: int, fps: int, write_limit: int,
+                 on_access_unit=None, multicast: Optional[MulticastTarget] = None,
+                 rtp_port: int = 8000):
+        self.source = source
+        self.multicast = multicast
+        self.rtp_port = rtp_port  # RTP/RTCP ports for UDP sessions (as MediaMTX uses)
+        self.on_access_unit = on_access_unit  # Called with (nals, keyframe) per frame
+        self.path = path
+        self.port = port
+        self.fps = fps
+        self.write_limit = write_limit  # Bytes buffered for a TCP reader before dropping
+        self.sessions: dict = {}
+        self.sps: Optional[bytes] = None
+        self.pps: Optional[bytes] = None
+        self.ready = threading.Event()
+        self.error: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._parameter_sets = None  # asyncio.Event, created on the server loop
+        self._closables: list = []  # Listener and datagram transports, closed on stop
+        self._source_task: Optional[asyncio.Task] = None
+        self._rtp_transport = None
+        self._multicast_transport = None
+        self._multicast_waiting = True  # Group gets packets from the next keyframe
+        self.multicast_packets = 0
+        self._seq = random.getrandbits(16)
+        self._ssrc = random.getrandbits(32)
+        self._timestamp = 0
+        self._au_has_slice = False
+        self._au_nals: list = []
+        self._au_keyframe = False
+        self._thread = threading.Thread(target=self._run, name="rtsp-server", daemon=True)
+
+    def start(self, timeout: float = 5.0) -> bool:
+        self._thread.start()
+        self.ready.wait(timeout)
+        return self.ready.is_set() and self.error is None
+
+    def stop(self) -> None:
+        if self._loop and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._shutdown)
+        self._thread.join(timeout=5)
+
+    def _shutdown(self) -> None:
+        for session in list(self.sessions.values()):
+            session.writer.close()
+        for closable in self._closables:
+            closable.close()
+        for task in asyncio.all_tasks(self._loop):
+            task.cancel()
+        # Transports release their sockets on the next iteration, so stop after it
+        self._loop.call_soon(self._loop.stop)
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+            self._loop.run_forever()
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.ready.set()
+            self._loop.close()
+
+    async def _serve(self) -> None:
+        self._parameter_sets = asyncio.Event()
+        self._closables.append(
+            await asyncio.start_server(self._handle_client, "0.0.0.0", self.port))
+        loop = asyncio.get_running_loop()
+        self._rtp_transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, local_addr=("0.0.0.0", self.rtp_port))
+        # RTCP receiver reports are accepted and ignored
+        rtcp_transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, local_addr=("0.0.0.0", self.rtp_port + 1))
+        self._closables += [self._rtp_transport, rtcp_transport]
+        if self.multicast:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicast.ttl)
+            # Local viewers (and the loopback benchmark) receive the group too
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            if self.multicast.interface:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                                socket.inet_aton(self.multicast.interface))
+            self._multicast_transport, _ = await loop.create_datagram_endpoint(
+                asyncio.DatagramProtocol, sock=sock)
+            self._closables.append(self._multicast_transport)
+        reader = asyncio.StreamReader(limit=self.READ_SIZE * 4)
+        pipe_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), self.source)
+        self._closables.append(pipe_transport)
+        # Keep a reference: the loop only holds tasks weakly
+        self._source_task = loop.create_task(self._read_source(reader))
+        print(f"Built-in RTSP server listening on :{self.port}")
+        self.ready.set()
+
+    # Source side -----------------------------------------------------------
+
+    async def _read_source(self, reader: asyncio.StreamReader) -> None:
+        """Split the Annex B stream into NAL units, copying each one out once."""
+        buffer = bytearray()
+        scan = 0  # Where the search for the next start code resumes
+        while True:
+            chunk = await reader.read(self.READ_SIZE)
+            if not chunk:
+                break
+            buffer += chunk
+            start = buffer.find(b"\x00\x00\x01")
+            if start < 0:
+                del buffer[:-2]
+                continue
+            with memoryview(buffer) as view:
+                while True:
+                    nal_start = start + 3
+                    next_start = buffer.find(b"\x00\x00\x01", max(nal_start, scan))
+                    if next_start < 0:
+                        break
+                    # A zero before the next start code belongs to its 4-byte form
+                    end = next_start - 1 if buffer[next_start - 1] == 0 else next_start
+                    if end > nal_start:
+                        self._on_nal(view[nal_start:end].tobytes())
+                    start = next_start
+            # Drop what has been consumed; a large NAL is only rescanned where new data landed
+            del buffer[:start]
+            scan = max(len(buffer) - 2, 0)
+        print("Built-in RTSP server: camera stream ended")
+
+    def _on_nal(self, nal: bytes) -> None:
+        nal_type = nal[0] & 0x1F
+        if nal_type == 7:
+            self.sps = bytes(nal)
+        elif nal_type == 8:
+            self.pps = bytes(nal)
+            if self.sps:
+                self._parameter_sets.set()
+
+        is_slice = nal_type in (1, 5)
+        # AUD/SEI/SPS/PPS, or a slice with first_mb_in_slice == 0, starts a new frame
+        starts_frame = nal_type in (6, 7, 8, 9) or (is_slice and len(nal) > 1 and nal[1] & 0x80)
+        if starts_frame and self._au_has_slice or self._timestamp == 0:
+            self._timestamp = time.monotonic_ns() * 9 // 100000  # 90 kHz clock
+            self._au_has_slice = False
+        self._au_has_slice |= is_slice
+
+        # The Pi encoder emits one slice per frame, so a slice ends the frame
+        packets = rtp_packetize([nal], self._seq, self._timestamp, self._ssrc, self.MTU, marker=is_slice)
+        self._seq = (self._seq + len(packets)) & 0xFFFF
+        self._fan_out(packets, keyframe=nal_type in (5, 7))
+
+        if self.on_access_unit:
+            self._au_nals.append(nal)
+            self._au_keyframe |= nal_type == 5
+            if is_slice:
+                self.on_access_unit(self._au_nals, self._au_keyframe)
+                self._au_nals, self._au_keyframe = [], False
+
+    def _fan_out(self, packets: list, keyframe: bool) -> None:
+        multicast_viewers = 0
+        for session in list(self.sessions.values()):
+            if not session.playing:
+                continue
+            if session.transport == "multicast":
+                multicast_viewers += 1
+                continue
+            if session.waiting_for_keyframe:
+                if not keyframe:
+                    continue
+                session.waiting_for_keyframe = False
+            if session.transport == "udp":
+                for packet in packets:
+                    self._rtp_transport.sendto(packet, session.udp_address)
+                continue
+            transport = session.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.write_limit:
+                # Reader can't keep up: drop until the next keyframe
+                session.dropped += 1
+                session.waiting_for_keyframe = True
+                continue
+            frames = []
+            for packet in packets:
+                frames += [struct.pack("!cBH", b"$", session.channel, len(packet)), packet]
+            session.writer.writelines(frames)
+
+        # One copy for the whole group, whatever the number of multicast viewers
+        if not multicast_viewers:
+            self._multicast_waiting = True
+        elif keyframe or not self._multicast_waiting:
+            self._multicast_waiting = False
+            group = (self.multicast.group, self.multicast.rtp_port)
+            for packet in packets:
+                self._multicast_transport.sendto(packet, group)
+            self.multicast_packets += len(packets)
+
+    # RTSP side -------------------------------------------------------------
+
+    def _sdp(self, host: str) -> str:
+        sprop = ",".join(base64.b64encode(nal).decode() for nal in (self.sps, self.pps))
+        return (
+            "v=0\r\n"
+            f"o=- 0 0 IN IP4 {host}\r\n"
+            "s=RPI-RTSP\r\n"
+            "c=IN IP4 0.0.0.0\r\n"
+            "t=0 0\r\n"
+            "a=control:*\r\n"
+            "m=video 0 RTP/AVP 96\r\n"
+            "a=rtpmap:96 H264/90000\r\n"
+            f"a=fmtp:96 packetization-mode=1; profile-level-id={self.sps[1:4].hex()}; "
+            f"sprop-parameter-sets={sprop}\r\n"
+            f"a=framerate:{self.fps}\r\n"
+            "a=control:trackID=0\r\n"
+        )
+
+    def _path_matches(self, url: str) -> bool:
+        path = urllib.parse.urlsplit(url).path.strip("/")
+        return path in (self.path, f"{self.path}/trackID=0")
+
+    async def _handle_client(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter) -> None:
+        session: Optional[_RTSPSession] = None
+        peer_host = writer.get_extra_info("peername")[0]
+        local_host = writer.get_extra_info("sockname")[0]
+        try:
+            while True:
+                first = await reader.readexactly(1)
+                if first == b"$":
+                    # Interleaved RTCP from the client: skip it
+                    header = await reader.readexactly(3)
+                    await reader.readexactly(int.from_bytes(header[1:], "big"))
+                    continue
+                head = (first + await reader.readuntil(b"\r\n\r\n")).decode(errors="replace")
+                lines = head.split("\r\n")
+                method, url = (lines[0].split() + ["", ""])[:2]
+                headers = {}
+                for line in lines[1:]:
+                    key, _, value = line.partition(":")
+                    if value:
+                        headers[key.strip().lower()] = value.strip()
+                try:
+                    content_length = int(headers.get("content-length", 0))
+                except ValueError:
+                    break  # Can't tell where the next request starts
+                if content_length > 0:
+                    await reader.readexactly(content_length)
+
+                status, extra, body = 200, {}, ""
+                if method == "OPTIONS":
+                    extra["Public"] = "OPTIONS, DESCRIBE, SETUP, PLAY, TEARDOWN, GET_PARAMETER, SET_PARAMETER"
+                elif method == "DESCRIBE":
+                    if not self._path_matches(url):
+                        status = 404
+                    else:
+                        try:
+                            await asyncio.wait_for(self._parameter_sets.wait(), 5)
+                            body = self._sdp(local_host)
+                            base = url if url.endswith("/") else url + "/"
+                            extra.update({"Content-Type": "application/sdp", "Content-Base": base})
+                        except asyncio.TimeoutError:
+                            status = 503
+                elif method == "SETUP":
+                    if not self._path_matches(url):
+                        status = 404
+                    else:
+                        session = session or _RTSPSession(os.urandom(8).hex(), writer)
+                        spec = headers.get("transport", "")
+                        params = dict(p.partition("=")[::2] for p in spec.split(";"))
+                        try:
+                            if "interleaved" in params or "TCP" in spec.split(";")[0]:
+                                session.channel = int(params.get("interleaved", "0-1").split("-")[0])
+                                session.transport = "tcp"
+                                extra["Transport"] = (f"RTP/AVP/TCP;unicast;interleaved="
+                                                      f"{session.channel}-{session.channel + 1}")
+                            elif "client_port" in params:
+                                rtp_port = int(params["client_port"].split("-")[0])
+                                session.transport = "udp"
+                                session.udp_address = (peer_host, rtp_port)
+                                extra["Transport"] = (f"RTP/AVP;unicast;client_port={params['client_port']};"
+                                                      f"server_port={self.rtp_port}-{self.rtp_port + 1}")
+                            elif "multicast" in params and self.multicast:
+                                session.transport = "multicast"
+                                target = self.multicast
+                                extra["Transport"] = (f"RTP/AVP;multicast;destination={target.group};"
+                                                      f"port={target.rtp_port}-{target.rtcp_port};"
+                                                      f"ttl={target.ttl}")
+                            else:
+                                status = 461  # Unsupported transport
+                        except ValueError:
+                            status = 400  # Malformed interleaved channel or client port
+                        if status == 200:
+                            self.sessions[session.id] = session
+                            extra["Session"] = f"{session.id};timeout=60"
+                elif method == "PLAY":
+                    if session is None:
+                        status = 454  # Session not found
+                    else:
+                        session.playing = True
+                        extra["Session"] = session.id
+                        extra["Range"] = "npt=0.000-"
+                elif method == "TEARDOWN":
+                    if session:
+                        self.sessions.pop(session.id, None)
+                        session = None
+                elif method not in ("GET_PARAMETER", "SET_PARAMETER"):
+                    status = 501
+
+                reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 454: "Session Not Found",
+                          461: "Unsupported Transport", 501: "Not Implemented",
+                          503: "Service Unavailable"}[status]
+                response = [f"RTSP/1.0 {status} {reason}", f"CSeq: {headers.get('cseq', '0')}"]
+                response += [f"{k}: {v}" for k, v in extra.items()]
+                if body:
+                    response.append(f"Content-Length: {len(body.encode())}")
+                writer.write(("\r\n".join(response) + "\r\n\r\n" + body).encode())
+                await writer.drain()
+                if method == "TEARDOWN":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, OSError):
+            pass
+        finally:
+            if session:
+                self.sessions.pop(session.id, None)
+            writer.close()
+
+
+class StartupTimeline:
+    """Monotonic timings of the phases of one server start, reported as one JSON line."""
+
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.phases: list = []  # (name, start, end)
+        try:
+            # Includes time spent before this process existed, e.g. boot
+            self.since_boot: Optional[float] = time.clock_gettime(time.CLOCK_BOOTTIME)
+        except (AttributeError, OSError):
+            self.since_boot = None
+        try:
+            # Field 22 of /proc/self/stat: process start in clock ticks after boot
+            stat = Path("/proc/self/stat").read_text()
+            ticks = int(stat.rsplit(")", 1)[1].split()[19])
+            self.process_start: Optional[float] = ticks / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, IndexError):
+            self.process_start = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start, time.monotonic()))
+
+    def to_json(self, **extra) -> str:
+        end = max((phase[2] for phase in self.phases), default=self.origin)
+        return json.dumps({
+            "event": "startup",
+            **extra,
+            "since_boot_s": None if self.since_boot is None else round(self.since_boot, 3),
+            "process_start_s": None if self.process_start is None else round(self.process_start, 2),
+            "phases": [{"phase": name, "at_ms": round((start - self.origin) * 1000, 1),
+                        "ms": round((stop - start) * 1000, 1)}
+                       for name, start, stop in self.phases],
+            "total_ms": round((end - self.origin) * 1000, 1),
+        })
+
+
+class RTSPStreamer:
+    """Manages the RTSP streaming using MediaMTX's native Pi camera support."""
+
+    # Runtime files in RUNTIME_DIR; benchmarks use their own so they never
+    # touch those of a running service
+    pid_path = PID_PATH
+    config_prefix = "rpi-rtsp-mediamtx"
+
+    def __init__(self, config: StreamConfig, mediamtx_path: Optional[str] = None,
+                 config_path: Path = CONFIG_PATH, timeline: Optional[StartupTimeline] = None,
+                 profile_startup: bool = False):
+        self.config = config
+        self.config_path = config_path
+        self.mediamtx_path = mediamtx_path
+        # Phases of the start in progress; `timeline` may already hold the caller's (config load)
+        self.timeline = timeline
+        self.profile_startup = profile_startup  # Also time the first RTP packet on every start
+        self.mediamtx_proc: Optional[subprocess.Popen] = None
+        self.camera_proc: Optional[subprocess.Popen] = None  # rpicam-vid for the built-in server
+        self.python_server: Optional[H264RTSPServer] = None
+        self.frame_buses: dict = {}  # path -> FrameBusWriter
+        self.event_recorders: dict = {}  # path -> EventRecorder
+        self.segment_recorders: dict = {}  # path -> SegmentRecorder
+        self.snapshots: dict = {}  # path -> SnapshotCache
+        self._recording_key = None  # Settings and streams the recorders run with
+        self.frame_taps: dict = {}  # path -> FrameTap feeding both (MediaMTX backend)
+        self.control: Optional[ControlServer] = None
+        self.backend = "mediamtx"  # Backend in use: "mediamtx" or "python"
+        self.log_pump: Optional[LogPump] = None
+        self.config_watcher: Optional[ConfigWatcher] = None
+        self._reload_pending = threading.Event()
+        self.path_status: dict = {}
+        self.time_to_ready: Optional[float] = None  # Seconds, most recent start
+        self.bitrate_controllers: dict = {}  # Path name -> BitrateController
+        self._delivery_counters: dict = {}  # Session/path id -> last counter values
+        self._next_abr_sample = 0.0
+        self.thermal_governor: Optional[ThermalGovernor] = None
+        self._applied_thermal_level = 0
+        self._next_thermal_check = 0.0
+        self.metrics: Optional[MetricsExporter] = None
+        self._next_status_check = 0.0
+        self.running = False
+
+        # Supervisor state
+        self.restart_count = 0
+        self.starts = 0  # Server starts, including restarts for config changes
+        self.last_outage: Optional[float] = None  # Seconds of the most recent outage
+        self.total_outage = 0.0
+        self._crash_times: deque = deque()
+        self._consecutive_failures = 0
+        self._up_since = 0.0
+
+    @property
+    def child_proc(self) -> Optional[subprocess.Popen]:
+        """The process the supervisor watches for the active backend."""
+        return self.camera_proc if self.backend == "python" else self.mediamtx_proc
+
+    @property
+    def backend_name(self) -> str:
+        return "Built-in server" if self.backend == "python" else "MediaMTX"
+
+    def _use_python_backend(self) -> bool:
+        if self.config.backend == "python":
+            return True
+        if self.config.backend == "auto" and not self._find_mediamtx():
+            print("MediaMTX not found, using the built-in RTSP server")
+            return True
+        return False
+
+    def _find_mediamtx(self) -> Optional[str]:
+        """Find MediaMTX executable."""
+        if self.mediamtx_path:
+            return self.mediamtx_path
+
+        search_paths = [
+            Path(__file__).parent / "mediamtx",
+            Path("/usr/local/bin/mediamtx"),
+            Path("/usr/bin/mediamtx"),
+            Path.home() / "mediamtx" / "mediamtx",
+        ]
+
+        for path in search_paths:
+            if path.exists() and os.access(path, os.X_OK):
+                return str(path)
+
+        # Check PATH
+        try:
+            result = subprocess.run(
+                ["which", "mediamtx"],
+                capture_output=True,
+                text=True
+            )
+            if result.returncode == 0:
+                return result.stdout.strip()
+        except Exception:
+            pass
+
+        return None
+
+    def _is_port_open(self, host: str, port: int) -> bool:
+        """Check if a port is open."""
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except Exception:
+            return False
+
+    def _wait_for_port(self, host: str, port: int, timeout: float = 10.0) -> bool:
+        """Wait for a port to become available."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._is_port_open(host, port):
+                return True
+            time.sleep(0.2)
+        return False
+
+    def _wait_for_ready(self, ready: threading.Event, timeout: float = 10.0) -> bool:
+        """Wait for MediaMTX to log that its RTSP listener is open.
+
+        The port is probed only as a fallback (e.g. a MediaMTX version whose
+        log wording differs), at most once per check interval.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if ready.wait(0.5):
+                return True
+            if self.mediamtx_proc and self.mediamtx_proc.poll() is not None:
+                return False
+            if self._is_port_open("127.0.0.1", self.config.port):
+                return True
+        return ready.is_set()
+
+    def _api_request(self, method: str, endpoint: str, body: Optional[dict] = None,
+                     timeout: float = 2.0) -> Optional[dict]:
+        """Call the MediaMTX control API. Returns the decoded JSON or None on error."""
+        if self.backend == "python":
+            return None  # The built-in server has no control API
+        url = f"http://127.0.0.1:{self.config.api_port}{endpoint}"
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method)
+        if data is not None:
+            request.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                payload = response.read()
+        except (urllib.error.URLError, OSError):
+            return None
+        if not payload:
+            return {}
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+
+    def _fetch_path_status(self) -> Optional[dict]:
+        """Per-path status from the API: {name: {"ready": bool, "readers": int}}."""
+        listing = self._api_request("GET", "/v3/paths/list")
+        if listing is None:
+            return None
+        return {
+            item.get("name"): {
+                "ready": bool(item.get("ready")),
+                "readers": len(item.get("readers") or []),
+            }
+            for item in listing.get("items", [])
+        }
+
+    def _wait_for_paths_ready(self, paths: list, timeout: float = 10.0) -> list:
+        """Wait until the API reports every path as ready (camera delivering frames).
+
+        Returns the paths that are still not ready.
+        """
+        deadline = time.monotonic() + timeout
+        pending = list(paths)
+        while pending and time.monotonic() < deadline:
+            status = self._fetch_path_status() or {}
+            pending = [p for p in pending if not status.get(p, {}).get("ready")]
+            if not pending:
+                break
+            if self.mediamtx_proc and self.mediamtx_proc.poll() is not None:
+                break
+            time.sleep(0.1)
+        return pending
+
+    def _counter_delta(self, key: str, values: tuple) -> Optional[tuple]:
+        """Difference between `values` and the previous values seen for `key`."""
+        previous = self._delivery_counters.get(key)
+        self._delivery_counters[key] = values
+        if previous is None:
+            return None
+        return tuple(new - old for new, old in zip(values, previous))
+
+    def _sample_delivery(self, path: str) -> Optional[DeliverySample]:
+        """Delivery ratio of the median reader of `path` since the last sample.
+
+        Only the ratio: a reader session's rtpPacketsLost and rtpPacketsJitter
+        describe RTP it sends us (none), not the receiver reports about what
+        it got, so they stay 0.
+        """
+        paths = self._api_request("GET", "/v3/paths/list")
+        sessions = self._api_request("GET", "/v3/rtspsessions/list")
+        if paths is None or sessions is None:
+            return None
+        received = next((p.get("bytesReceived", 0) for p in paths.get("items", [])
+                         if p.get("name") == path), None)
+        if received is None:
+            return None
+        produced = self._counter_delta(f"path:{path}", (received,))
+
+        # Forget sessions that have ended, or the counters grow with every reader ever seen
+        live = {f"session:{item.get('id')}" for item in sessions.get("items", [])}
+        for key in [k for k in self._delivery_counters if k.startswith("session:") and k not in live]:
+            del self._delivery_counters[key]
+
+        samples = []
+        for item in sessions.get("items", []):
+            if item.get("path") != path or item.get("state") != "read":
+                continue
+            delta = self._counter_delta(f"session:{item.get('id')}", (item.get("bytesSent", 0),))
+            if delta is None or produced is None or produced[0] <= 0:
+                continue
+            samples.append(DeliverySample(delivery=min(1.0, delta[0] / produced[0])))
+        if not samples:
+            return None
+        samples.sort(key=lambda sample: sample.delivery)
+        return samples[len(samples) // 2]
+
+    def _adapt_bitrate(self) -> None:
+        """Run one step of the adaptive bitrate controller for every camera path."""
+        for stream in self.config.stream_definitions():
+            controller = self.bitrate_controllers.get(stream.path)
+            if controller is None:
+                current = self.config.degraded(stream, self._applied_thermal_level)
+                # While thermally degraded, the ladder's bitrate is the ceiling
+                ceiling = current.bitrate if self._applied_thermal_level else (
+                    self.config.abr_max_bitrate or stream.bitrate)
+                controller = BitrateController(
+                    current.bitrate, current.idr_period, self.config.abr_min_bitrate,
+                    ceiling, self.config.abr_min_idr_period,
+                )
+                self.bitrate_controllers[stream.path] = controller
+
+            sample = self._sample_delivery(stream.path)
+            if sample is None or not controller.update(sample):
+                continue
+            patch = {"rpiCameraBitrate": controller.bitrate,
+                     "rpiCameraIDRPeriod": controller.idr_period}
+            if self._api_request("PATCH", f"/v3/config/paths/patch/{stream.path}", patch) is None:
+                continue
+            print(f"Path '{stream.path}': bitrate {controller.bitrate / 1000000:.2f} Mbps, "
+                  f"idr_period {controller.idr_period} (loss {sample.loss:.1%}, "
+                  f"delivery {sample.delivery:.0%})")
+
+    def _govern_thermals(self) -> None:
+        """Move every camera path to the thermal governor's current ladder level."""
+        if self.thermal_governor is None:
+            ladder = self.config.thermal_ladder or DEFAULT_THERMAL_LADDER
+            self.thermal_governor = ThermalGovernor(
+                len(ladder), self.config.thermal_step_down_temp,
+                self.config.thermal_step_up_temp, self.config.thermal_hold,
+                self.config.thermal_step_down_hold,
+            )
+        governor = self.thermal_governor
+        governor.update()
+        level = governor.level
+        if level == self._applied_thermal_level:
+            return
+
+        if not self._patch_thermal_level(self._applied_thermal_level, level):
+            return
+        direction = "down" if level > self._applied_thermal_level else "up"
+        temperature = "n/a" if governor.temperature is None else f"{governor.temperature:.1f}C"
+        throttled = "n/a" if governor.throttled is None else hex(governor.throttled)
+        print(f"Thermal governor: stepped {direction} to level {level} "
+              f"(temperature {temperature}, throttled {throttled})")
+        self._applied_thermal_level = level
+        # Let the bitrate controllers restart from the new ceiling
+        self.bitrate_controllers = {}
+
+    def _patch_thermal_level(self, old_level: int, new_level: int) -> bool:
+        """Move every camera path from ladder level `old_level` to `new_level`."""
+        for stream in self.config.stream_definitions():
+            old = self.config.degraded(stream, old_level).path_settings()
+            new = self.config.degraded(stream, new_level).path_settings()
+            patch = {k: v for k, v in new.items() if old.get(k) != v}
+            if patch and self._api_request(
+                    "PATCH", f"/v3/config/paths/patch/{stream.path}", patch) is None:
+                return False
+        return True
+
+    def _report_path_status(self) -> None:
+        """Print per-path readiness and reader counts when they change."""
+        status = self._fetch_path_status()
+        if status is None:
+            return
+        for name in self.config.paths_settings():
+            current = status.get(name, {"ready": False, "readers": 0})
+            if current != self.path_status.get(name):
+                state = "ready" if current["ready"] else "not ready"
+                print(f"Path '{name}': {state}, {current['readers']} reader(s)")
+            self.path_status[name] = current
+
+    def _write_pid_file(self) -> None:
+        """Record the PID of the running MediaMTX (or camera) process."""
+        if not self.child_proc:
+            return
+        try:
+            tmp = self.pid_path.with_suffix(".tmp")
+            tmp.write_text(f"{self.child_proc.pid}\n")
+            os.replace(tmp, self.pid_path)
+        except OSError as e:
+            print(f"WARNING: Could not write PID file {self.pid_path}: {e}")
+
+    def _remove_pid_file(self) -> None:
+        try:
+            recorded = int(self.pid_path.read_text().strip())
+        except (OSError, ValueError):
+            return
+        # Only remove the file if it still refers to our process
+        if self.child_proc and recorded == self.child_proc.pid:
+            with contextlib.suppress(OSError):
+                self.pid_path.unlink()
+
+    @staticmethod
+    def _is_child_pid(pid: int) -> bool:
+        """Check the PID still belongs to one of our child programs (guards against PID reuse)."""
+        try:
+            cmdline = Path(f"/proc/{pid}/cmdline").read_bytes()
+        except OSError:
+            return False
+        # argv[1] covers a script run through its interpreter
+        argv = cmdline.split(b"\0")[:2]
+        return any(os.path.basename(arg) in CHILD_NAMES for arg in argv)
+
+    @staticmethod
+    def _wait_for_exit(pid: int, timeout: float) -> bool:
+        """Wait until `pid` has exited. Uses a pidfd where available."""
+        if hasattr(os, "pidfd_open"):
+            try:
+                fd = os.pidfd_open(pid)
+            except ProcessLookupError:
+                return True
+            except OSError:
+                fd = None
+            if fd is not None:
+                try:
+                    poller = select.poll()
+                    poller.register(fd, select.POLLIN)
+                    return bool(poller.poll(timeout * 1000))
+                finally:
+                    os.close(fd)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+            time.sleep(0.02)
+        return False
+
+    def _kill_existing_processes(self) -> None:
+        """Stop a MediaMTX left behind by a previous run, using the PID file."""
+        try:
+            pid = int(self.pid_path.read_text().strip())
+        except (OSError, ValueError):
+            return
+
+        if self._is_child_pid(pid):
+            print(f"Stopping leftover streaming process (PID {pid})...")
+            try:
+                os.kill(pid, signal.SIGTERM)
+                if not self._wait_for_exit(pid, timeout=3.0):
+                    os.kill(pid, signal.SIGKILL)
+                    self._wait_for_exit(pid, timeout=2.0)
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                print(f"WARNING: Not permitted to stop PID {pid}")
+                return
+
+        with contextlib.suppress(OSError):
+            self.pid_path.unlink()
+
+    def paths_settings(self) -> dict:
+        """MediaMTX paths to serve."""
+        return self.config.paths_settings()
+
+    def _write_mediamtx_config(self) -> Path:
+        """Write the generated MediaMTX config to tmpfs, reusing an identical one."""
+        content = render_mediamtx_config(self.config, self.paths_settings())
+        digest = hashlib.sha256(content.encode()).hexdigest()[:16]
+        path = RUNTIME_DIR / f"{self.config_prefix}-{digest}.yml"
+        if not path.exists():
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(content)
+            os.replace(tmp, path)
+            # Drop configs generated for earlier settings
+            for stale in RUNTIME_DIR.glob(f"{self.config_prefix}-*.yml"):
+                if stale != path:
+                    with contextlib.suppress(OSError):
+                        stale.unlink()
+        return path
+
+    def _phase(self, name: str):
+        """Time a startup phase when a start is being recorded."""
+        return self.timeline.phase(name) if self.timeline else contextlib.nullcontext()
+
+    def _start_mediamtx(self) -> bool:
+        """Start MediaMTX with native Pi camera support."""
+        with self._phase("find_mediamtx"):
+            mediamtx_path = self._find_mediamtx()
+        if not mediamtx_path:
+            print("ERROR: MediaMTX not found. Please install it first.")
+            return False
+
+        # Configure MediaMTX with a generated config file
+        # Using native rpiCamera source
+        try:
+            with self._phase("write_config"):
+                config_file = self._write_mediamtx_config()
+        except OSError as e:
+            print(f"ERROR: Could not write MediaMTX config: {e}")
+            return False
+
+        print(f"Starting MediaMTX on port {self.config.port}...")
+        for stream in self.config.stream_definitions():
+            print(f"  /{stream.path}: camera {stream.camera}, {stream.resolution} "
+                  f"@ {stream.fps}fps, {stream.bitrate / 1000000:g} Mbps")
+            if stream.substream:
+                print(f"  /{stream.substream.path}: substream, {stream.substream.resolution} "
+                      f"@ {stream.substream.fps}fps")
+
+        launched_at = time.monotonic()
+        try:
+            with self._phase("popen"):
+                self.mediamtx_proc = subprocess.Popen(
+                    [mediamtx_path, str(config_file)],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                )
+        except Exception as e:
+            print(f"ERROR: Failed to start MediaMTX: {e}")
+            return False
+
+        self._write_pid_file()
+
+        # Keep draining stdout for the lifetime of the process
+        self.log_pump = LogPump(
+            self.mediamtx_proc.stdout,
+            max_lines=self.config.log_buffer,
+            rate=self.config.log_rate,
+        )
+        ready = self.log_pump.watch(RTSP_READY_MARKER)
+        self.log_pump.start()
+
+        # Wait for the RTSP listener to come up
+        with self._phase("port_ready"):
+            listening = self._wait_for_ready(ready)
+        if not listening:
+            print("ERROR: MediaMTX failed to start (RTSP listener not ready)")
+            self._stop_mediamtx()
+            self._print_recent_output()
+            return False
+
+        if self.config.wait_for_path:
+            # On-demand paths only become ready once somebody reads them
+            always_on = [s.path for s in self.config.stream_definitions() if not s.on_demand]
+            with self._phase("paths_ready"):
+                pending = self._wait_for_paths_ready(always_on)
+            if pending:
+                print(f"ERROR: Path(s) did not become ready: {', '.join(pending)}")
+                self._stop_mediamtx()
+                self._print_recent_output()
+                return False
+
+        self._mark_started(launched_at)
+        print("MediaMTX started successfully")
+        return True
+
+    def _mark_started(self, launched_at: float) -> None:
+        self._up_since = time.monotonic()
+        self.time_to_ready = self._up_since - launched_at
+        # The encoder starts from the configured settings again
+        self.bitrate_controllers = {}
+        self._applied_thermal_level = 0
+        self._delivery_counters = {}
+
+    def _start_python_server(self) -> bool:
+        """Start rpicam-vid and serve its H.264 output with the built-in server."""
+        streams = self.config.stream_definitions()
+        if len(streams) > 1 or streams[0].substream:
+            print("ERROR: The built-in server supports a single stream without substream")
+            return False
+        stream = streams[0]
+        if self.config.webrtc or self.config.srt or self.config.srt_publish_url or self.config.hls:
+            print("WARNING: WebRTC, SRT and HLS need the MediaMTX backend; serving RTSP only")
+        with self._phase("find_camera"):
+            camera = shutil.which("rpicam-vid") or shutil.which("libcamera-vid")
+        if not camera:
+            print("ERROR: rpicam-vid not found. Please install rpicam-apps.")
+            return False
+
+        print(f"Starting built-in RTSP server on port {self.config.port}...")
+        print(f"  /{stream.path}: camera {stream.camera}, {stream.resolution} "
+              f"@ {stream.fps}fps, {stream.bitrate / 1000000:g} Mbps")
+        command = [
+            camera, "--timeout", "0", "--nopreview", "--inline", "--flush",
+            "--codec", "h264", "--profile", stream.profile,
+            "--level", "4" if stream.level == "4.0" else stream.level,
+            "--camera", str(stream.camera),
+            "--width", str(stream.width), "--height", str(stream.height),
+            "--framerate", str(stream.fps), "--bitrate", str(stream.bitrate),
+            "--intra", str(stream.idr_period), "--output", "-",
+        ]
+        launched_at = time.monotonic()
+        try:
+            with self._phase("popen"):
+                self.camera_proc = subprocess.Popen(
+                    command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        except Exception as e:
+            print(f"ERROR: Failed to start {camera}: {e}")
+            return False
+
+        self.python_server = H264RTSPServer(
+            self.camera_proc.stdout, stream.path, self.config.port, stream.fps,
+            self.config.write_queue_size * self.config.udp_max_payload_size,
+            on_access_unit=lambda nals, keyframe: self._on_frame(stream.path, nals, keyframe),
+            multicast=self.config.multicast_target(), rtp_port=self.config.rtp_port)
+        self._write_pid_file()
+        self.log_pump = LogPump(
+            self.camera_proc.stderr,
+            max_lines=self.config.log_buffer,
+            rate=self.config.log_rate,
+            name=os.path.basename(camera),
+        )
+        self.log_pump.start()
+
+        with self._phase("port_ready"):
+            listening = self.python_server.start()
+        if not listening:
+            print(f"ERROR: Built-in RTSP server failed to start: {self.python_server.error}")
+            self._stop_server()
+            self._print_recent_output()
+            return False
+
+        self._mark_started(launched_at)
+        print("Built-in RTSP server started successfully")
+        return True
+
+    def _start_server(self) -> bool:
+        """Start the configured RTSP backend and report the startup timeline."""
+        self.timeline = self.timeline or StartupTimeline()
+        with self._phase("select_backend"):
+            self.backend = "python" if self._use_python_backend() else "mediamtx"
+        if self.backend == "python":
+            ok = self._start_python_server()
+        else:
+            if self.config.multicast and (self.config.multicast_ttl != 1 or self.config.multicast_interface):
+                print("NOTE: MediaMTX ignores multicast_ttl/multicast_interface; "
+                      "route the multicast range to the interface instead")
+            ok = self._start_mediamtx()
+        if ok and self.profile_startup:
+            self._time_first_rtp()
+        self.starts += 1
+        print(self.timeline.to_json(start=self.starts, backend=self.backend, ok=ok))
+        self.timeline = None
+        return ok
+
+    def _time_first_rtp(self) -> None:
+        """Read the first stream over loopback until its first RTP packet arrives."""
+        stream = self.config.stream_definitions()[0]
+        url = f"rtsp://127.0.0.1:{self.config.port}/{stream.path}"
+        try:
+            with self._phase("first_rtp"):
+                asyncio.run(_time_first_frame(url, stream.on_demand_start_timeout + 5))
+        except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            self.timeline.phases.pop()
+            print(f"WARNING: No RTP packet from {url}: {e or type(e).__name__}")
+
+    def _print_recent_output(self, count: int = 50) -> None:
+        """Print the last lines MediaMTX (or rpicam-vid) wrote, for debugging."""
+        if not self.log_pump:
+            return
+        self.log_pump.join(timeout=0.5)
+        lines = self.log_pump.tail(count)
+        if lines:
+            print(f"{self.backend_name} output (most recent last):")
+            for line in lines:
+                print(f"  {line}")
+
+    def start(self) -> bool:
+        """Start the RTSP stream."""
+        print("=" * 50)
+        print("RPI-RTSP Streamer")
+        print("=" * 50)
+        print(f"Config: {self.config_path}")
+        try:
+            streams = self.config.stream_definitions()
+            self.config.recording_settings()
+            self.config.multicast_target()
+            self.config.srt_settings()
+            self.config.hls_settings()
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            return False
+        for stream in streams:
+            print(f"RTSP URL: rtsp://<pi-ip>:{self.config.port}/{stream.path} "
+                  f"({stream.resolution} @ {stream.fps}fps, {stream.profile} {stream.level}"
+                  + (f", {stream.preset})" if stream.preset else ")"))
+            if stream.substream:
+                print(f"RTSP URL: rtsp://<pi-ip>:{self.config.port}/{stream.substream.path} "
+                      f"({stream.substream.resolution} @ {stream.substream.fps}fps)")
+            if self.config.webrtc:
+                print(f"WebRTC:   http://<pi-ip>:{self.config.webrtc_port}/{stream.path} "
+                      f"(WHEP: /{stream.path}/whep)")
+            if self.config.hls:
+                print(f"LL-HLS:   http://<pi-ip>:{self.config.hls_port}/{stream.path}/index.m3u8")
+            if self.config.srt:
+                print("SRT URL:  " + self.config.srt_url(f"srt://<pi-ip>:{self.config.srt_port}",
+                                                        f"read:{stream.path}"))
+        print("=" * 50)
+
+        self.timeline = self.timeline or StartupTimeline()
+        with self._phase("kill_existing"):
+            self._kill_existing_processes()
+
+        if not self._start_server():
+            return False
+
+        self.running = True
+        self._sync_frame_consumers()
+        if self.config.watch_config:
+            self.config_watcher = ConfigWatcher(self.config_path, self._reload_pending.set)
+            self.config_watcher.start()
+        self._start_metrics()
+        self._start_control()
+        print("Stream started successfully!")
+        return True
+
+    def _start_metrics(self) -> None:
+        """(Re)start the metrics endpoint for the current config."""
+        if self.metrics:
+            self.metrics.stop()
+            self.metrics = None
+        if not self.config.metrics_port:
+            return
+        self.metrics = MetricsExporter(self, self.config.metrics_port, self.config.metrics_interval)
+        try:
+            self.metrics.start()
+            print(f"Metrics: http://<pi-ip>:{self.config.metrics_port}/metrics")
+        except OSError as e:
+            print(f"WARNING: Could not start metrics endpoint: {e}")
+            self.metrics = None
+
+    def _start_control(self) -> None:
+        """(Re)start the HTTP control endpoint for the current config."""
+        if self.control:
+            self.control.stop()
+            self.control = None
+        if not self.config.control_port:
+            return
+        self.control = ControlServer(self, self.config.control_port)
+        try:
+            self.control.start()
+            print(f"Control: http://<pi-ip>:{self.config.control_port}/")
+        except OSError as e:
+            print(f"WARNING: Could not start control endpoint: {e}")
+            self.control = None
+
+    def _on_frame(self, path: str, nals: list, keyframe: bool) -> None:
+        """Hand one encoded frame of `path` to its frame bus and event recorder."""
+        bus = self.frame_buses.get(path)
+        if bus:
+            bus.publish(nals, keyframe)
+        recorder = self.event_recorders.get(path)
+        if recorder:
+            recorder.push(nals, keyframe)
+        recorder = self.segment_recorders.get(path)
+        if recorder:
+            recorder.push(nals, keyframe)
+        snapshot = self.snapshots.get(path)
+        if snapshot:
+            snapshot.push(nals, keyframe)
+
+    def _sync_frame_consumers(self) -> None:
+        """Open, resize or close frame buses, event recorders and MediaMTX taps to match the config."""
+        config = self.config
+        paths = {s.path for s in config.stream_definitions()}
+        wanted = paths if config.frame_bus else set()
+        size = (config.frame_bus_slots, config.frame_bus_slot_size)
+        for path, bus in list(self.frame_buses.items()):
+            if path not in wanted or (bus.slots, bus.slot_size) != size:
+                self.frame_buses.pop(path).close()
+        for path in sorted(wanted - self.frame_buses.keys()):
+            try:
+                bus = FrameBusWriter(frame_bus_name(path), *size)
+            except (OSError, ValueError) as e:
+                print(f"WARNING: Could not create frame bus for '{path}': {e}")
+                continue
+            self.frame_buses[path] = bus
+            print(f"Frame bus: /dev/shm/{bus.name} ({bus.slots} x {bus.slot_size // 1024} KiB)")
+
+        wanted = paths if config.event_recording else set()
+        directory = Path(config.event_dir).expanduser()
+        for path in self.event_recorders.keys() - wanted:
+            del self.event_recorders[path]  # A recording in progress still finishes
+        for path in wanted:
+            recorder = self.event_recorders.get(path)
+            if recorder is None:
+                recorder = self.event_recorders[path] = EventRecorder(
+                    path, directory, config.event_pre_roll, config.event_post_roll)
+                print(f"Event recording: '{path}' keeps {config.event_pre_roll:g}s "
+                      f"of pre-roll, saves to {directory}")
+            recorder.directory = directory
+            recorder.pre_roll = config.event_pre_roll
+            recorder.post_roll = config.event_post_roll
+
+        recording = config.recording_settings()
+        streams = config.stream_definitions()
+        key = (recording, [(s.path, s.bitrate) for s in streams])
+        if key != self._recording_key:
+            self._stop_segment_recorders()
+            self._recording_key = key
+            if recording:
+                directory = Path(recording.dir).expanduser()
+                index = SegmentIndex(directory, recording.max_size_mb * 1000000,
+                                     recording.max_age_hours * 3600)
+                index.sweep()
+                for stream in streams:
+                    recorder = SegmentRecorder(stream.path, index, recording.segment_duration,
+                                               stream.bitrate, recording.preallocate)
+                    self.segment_recorders[stream.path] = recorder
+                    recorder.start()
+                print(f"Recording to {directory} in {recording.segment_duration:g}s segments "
+                      f"({len(index.segments)} existing, {index.total / 1e6:.0f} MB)")
+
+        wanted = paths if config.snapshot else set()
+        for path in self.snapshots.keys() - wanted:
+            self.snapshots.pop(path).close()
+        for stream in (s for s in streams if s.path in wanted):
+            if stream.path not in self.snapshots:
+                ffmpeg = shutil.which("ffmpeg")
+                if not ffmpeg:
+                    print("WARNING: ffmpeg not found, snapshots are unavailable")
+                self.snapshots[stream.path] = SnapshotCache(stream.path, config.snapshot_ttl, ffmpeg)
+            self.snapshots[stream.path].ttl = config.snapshot_ttl
+            self.snapshots[stream.path].start_timeout = stream.on_demand_start_timeout
+
+        # With MediaMTX the frames come from a loopback reader; the built-in server hands them over directly
+        wanted = (self.frame_buses.keys() | self.event_recorders.keys()
+                  | self.segment_recorders.keys())
+        if self.backend != "mediamtx":
+            wanted = set()
+        # Snapshots alone only read the path while they are being requested
+        for path, cache in self.snapshots.items():
+            tapped = self.backend == "mediamtx" and path not in wanted
+            cache.set_tap_url(f"rtsp://127.0.0.1:{config.port}/{path}" if tapped else None)
+        on_demand = {s.path for s in streams if s.on_demand}
+        for path, tap in list(self.frame_taps.items()):
+            if path not in wanted or tap.url != f"rtsp://127.0.0.1:{config.port}/{path}":
+                self.frame_taps.pop(path).stop()
+        for path in wanted - self.frame_taps.keys():
+            if path in on_demand:
+                print(f"WARNING: '{path}' is on_demand, but the frame bus and recorders read it "
+                      f"all the time, so its camera stays on")
+            tap = FrameTap(f"rtsp://127.0.0.1:{config.port}/{path}",
+                           lambda nals, keyframe, path=path: self._on_frame(path, nals, keyframe))
+            self.frame_taps[path] = tap
+            tap.start()
+
+    def _stop_segment_recorders(self) -> None:
+        for recorder in self.segment_recorders.values():
+            recorder.stop()
+        self.segment_recorders = {}
+        self._recording_key = None
+
+    def trigger_event(self, path: Optional[str] = None) -> list:
+        """Start (or extend) event recordings on `path`, or on every path; returns the files."""
+        recorders = [self.event_recorders[path]] if path else list(self.event_recorders.values())
+        files = [recorder.trigger() for recorder in recorders]
+        for target in files:
+            print(f"Event triggered: recording to {target}")
+        return files
+
+    def _stop_mediamtx(self) -> None:
+        """Terminate the MediaMTX process if it is still running."""
+        if self.mediamtx_proc and self.mediamtx_proc.poll() is None:
+            try:
+                self.mediamtx_proc.terminate()
+                self.mediamtx_proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.mediamtx_proc.kill()
+            except Exception:
+                pass
+        self._remove_pid_file()
+
+    def _stop_server(self) -> None:
+        """Stop whichever backend is running."""
+        if self.backend == "python":
+            if self.camera_proc and self.camera_proc.poll() is None:
+                try:
+                    self.camera_proc.terminate()
+                    self.camera_proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.camera_proc.kill()
+            if self.python_server:
+                self.python_server.stop()
+                self.python_server = None
+            self._remove_pid_file()
+            return
+        self._stop_mediamtx()
+
+    def stop(self) -> None:
+        """Stop the stream."""
+        print("\nStopping stream...")
+        self.running = False
+        if self.config_watcher:
+            self.config_watcher.stop()
+        if self.metrics:
+            self.metrics.stop()
+        if self.control:
+            self.control.stop()
+        for tap in self.frame_taps.values():
+            tap.stop()
+        self.frame_taps = {}
+        for cache in self.snapshots.values():
+            cache.close()
+        self._stop_server()
+        self._stop_segment_recorders()
+        for bus in self.frame_buses.values():
+            bus.close()
+        self.frame_buses = {}
+        print("Stream stopped")
+
+    def reload_config(self) -> None:
+        """Apply changes from the config file with as little disruption as possible.
+
+        Paths are added, removed and patched through the control API, so
+        readers of unaffected paths stay connected; only server-level changes
+        (ports, buffer sizes) restart MediaMTX.
+        """
+        try:
+            with open(self.config_path) as f:
+                new = StreamConfig(**json.load(f))
+            new_paths = new.paths_settings()
+            new.recording_settings()
+            new.multicast_target()
+            new.srt_settings()
+            new.hls_settings()
+        except (OSError, ValueError, TypeError) as e:
+            print(f"WARNING: Ignoring invalid config change: {e}")
+            return
+
+        old = self.config
+        changed = new.diff(old)
+        if not changed:
+            return
+        print(f"Config changed: {', '.join(sorted(changed))}")
+        self.config = new
+
+        if self.log_pump:
+            self.log_pump.rate = new.log_rate
+        if not new.watch_config and self.config_watcher:
+            self.config_watcher.stop()
+        # The HTTP endpoints are ours, not MediaMTX's: recreate them in place
+        if changed & {"metrics_port", "metrics_interval"}:
+            self._start_metrics()
+        if "control_port" in changed:
+            self._start_control()
+
+        if changed & RESTART_FIELDS:
+            print(f"Restarting {self.backend_name} to apply changes...")
+            self._stop_server()
+            self._kill_existing_processes()
+            if not self._start_server():
+                print("ERROR: Restart with new config failed, reverting")
+                self.config = old
+                self._start_server()
+            return
+
+        if not (self._apply_path_changes(old.paths_settings(), new_paths)
+                and self._apply_global_changes(old.hls_settings(), new.hls_settings())):
+            print(f"WARNING: Live update failed, restarting {self.backend_name}")
+            self._stop_server()
+            self._start_server()
+            return
+        # The paths now carry the new config's full settings: step them back down
+        # to the thermal level in force
+        if self._applied_thermal_level and not self._patch_thermal_level(0, self._applied_thermal_level):
+            print("WARNING: Could not re-apply the thermal level after reload")
+            self._applied_thermal_level = 0
+        # Controllers hold the old bitrate, idr_period and limits, and would patch
+        # them back on their next step; rebuild them from the new config
+        self.bitrate_controllers = {}
+
+    def _apply_path_changes(self, old_paths: dict, new_paths: dict) -> bool:
+        """Bring MediaMTX's paths from `old_paths` to `new_paths` through the API."""
+        for name in old_paths.keys() - new_paths.keys():
+            if self._api_request("DELETE", f"/v3/config/paths/delete/{name}") is None:
+                return False
+            print(f"Removed path '{name}'")
+
+        for name, settings in new_paths.items():
+            if name not in old_paths:
+                if self._api_request("POST", f"/v3/config/paths/add/{name}", settings) is None:
+                    return False
+                print(f"Added path '{name}'")
+                continue
+            patch = {k: v for k, v in settings.items() if old_paths[name].get(k) != v}
+            removed = old_paths[name].keys() - settings.keys()
+            if removed:
+                # A patch can't unset keys; replacing resets them to MediaMTX's defaults
+                if self._api_request("POST", f"/v3/config/paths/replace/{name}", settings) is None:
+                    return False
+                print(f"Replaced path '{name}' (cleared {', '.join(sorted(removed))})")
+                continue
+            if not patch:
+                continue
+            if self._api_request("PATCH", f"/v3/config/paths/patch/{name}", patch) is None:
+                return False
+            print(f"Applied {', '.join(sorted(patch))} to path '{name}'")
+        return True
+
+    def _apply_global_changes(self, old_settings: dict, new_settings: dict) -> bool:
+        """Patch changed server-wide MediaMTX settings (e.g. HLS durations) through the API."""
+        patch = {k: v for k, v in new_settings.items() if old_settings.get(k) != v}
+        if not patch:
+            return True
+        if self._api_request("PATCH", "/v3/config/global/patch", patch) is None:
+            return False
+        print(f"Applied {', '.join(sorted(patch))}")
+        return True
+
+    def _backoff_delay(self) -> float:
+        """Delay before the next restart: immediate first, then jittered exponential."""
+        if self._consecutive_failures == 0:
+            return 0.0
+        delay = min(self.config.restart_backoff_max, 0.25 * 2 ** (self._consecutive_failures - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _record_crash(self) -> bool:
+        """Record a crash. Returns False once the crash-loop limit is exceeded."""
+        now = time.monotonic()
+        self._crash_times.append(now)
+        while self._crash_times and now - self._crash_times[0] > self.config.crash_loop_window:
+            self._crash_times.popleft()
+        return len(self._crash_times) <= self.config.crash_loop_limit
+
+    def _restart(self) -> bool:
+        """Bring the server back after an unexpected exit."""
+        down_at = time.monotonic()
+        # Release what the dead process leaves behind (the built-in server keeps its ports)
+        self._stop_server()
+        if not self._record_crash():
+            print(f"ERROR: {self.backend_name} crashed {len(self._crash_times)} times within "
+                  f"{self.config.crash_loop_window:.0f}s, giving up")
+            return False
+
+        while self.running:
+            delay = self._backoff_delay()
+            if delay:
+                print(f"Restarting {self.backend_name} in {delay:.2f}s...")
+                time.sleep(delay)
+            if not self.running:
+                return False
+
+            self._consecutive_failures += 1
+            self.restart_count += 1
+            if self._start_server():
+                self.last_outage = time.monotonic() - down_at
+                self.total_outage += self.last_outage
+                print(f"{self.backend_name} restarted (restart #{self.restart_count}, "
+                      f"outage {self.last_outage * 1000:.0f} ms)")
+                return True
+
+            if not self._record_crash():
+                print(f"ERROR: {self.backend_name} keeps failing to start, giving up")
+                return False
+        return False
+
+    def wait(self) -> bool:
+        """Supervise the server process until stopped, restarting it if it dies.
+
+        Returns False if supervision gave up because of a crash loop.
+        """
+        try:
+            while self.running:
+                try:
+                    self.child_proc.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    # Healthy for a while: the next crash restarts immediately again
+                    if time.monotonic() - self._up_since > self.config.crash_loop_window:
+                        self._consecutive_failures = 0
+                    if self._reload_pending.is_set():
+                        self._reload_pending.clear()
+                        self.reload_config()
+                        self._sync_frame_consumers()
+                    if time.monotonic() >= self._next_status_check:
+                        self._next_status_check = time.monotonic() + 5.0
+                        self._report_path_status()
+                    if self.config.abr and time.monotonic() >= self._next_abr_sample:
+                        self._next_abr_sample = time.monotonic() + self.config.abr_interval
+                        self._adapt_bitrate()
+                    if (self.config.thermal_governor
+                            and time.monotonic() >= self._next_thermal_check):
+                        self._next_thermal_check = time.monotonic() + self.config.thermal_interval
+                        self._govern_thermals()
+                    continue
+
+                if not self.running:
+                    break
+                print(f"{self.backend_name} process ended unexpectedly "
+                      f"(exit code {self.child_proc.returncode})")
+                self._print_recent_output()
+                if not self._restart():
+                    return False
+        except KeyboardInterrupt:
+            pass
+        return True
+
+
+# Stand-in for the MediaMTX binary used by the benchmarks: it logs and
+# listens like the real server, with a little randomised startup work.
+FAKE_MEDIAMTX = """#!/usr/bin/env python3
+import os, random, signal, socket, sys, time
+signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+config = open(sys.argv[1]).read() if len(sys.argv) > 1 else ""
+port = int(next((l.split(":")[-1].strip('" ') for l in config.splitlines()
+                 if l.startswith("rtspAddress:")), "8554"))
+print("INF MediaMTX (stand-in)", flush=True)
+time.sleep(random.uniform(0.01, 0.05))
+sock = socket.socket()
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+sock.bind(("127.0.0.1", port))
+sock.listen()
+print("INF [RTSP] listener opened on :%d (TCP)" % port, flush=True)
+while True:
+    conn, _ = sock.accept()
+    conn.close()
+"""
+
+
+def _percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _write_fake_mediamtx(directory: str) -> str:
+    path = Path(directory) / "mediamtx"
+    path.write_text(FAKE_MEDIAMTX)
+    path.chmod(0o755)
+    return str(path)
+
+
+class _RTPReceiver(asyncio.DatagramProtocol):
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    def datagram_received(self, data, addr):
+        self.queue.put_nowait(data)
+
+
+class RTSPClient:
+    """Minimal RTSP client (single video track, RTP over TCP, UDP or multicast) for benchmarks and taps."""
+
+    def __init__(self, url: str):
+        self.url = url
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 554
+        self.cseq = 0
+        self.session: Optional[str] = None
+        self.sdp = ""
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.transport = "tcp"
+        self._udp_queue: Optional[asyncio.Queue] = None
+        self._udp_transports: list = []
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, url: str, headers: Optional[dict] = None,
+                      body: str = "") -> tuple:
+        """Send a request and return (status, headers, body)."""
+        self.cseq += 1
+        lines = [f"{method} {url} RTSP/1.0", f"CSeq: {self.cseq}", "User-Agent: rpi-rtsp-bench"]
+        if self.session:
+            lines.append(f"Session: {self.session}")
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        if body:
+            lines.append(f"Content-Length: {len(body.encode())}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n" + body).encode())
+        await self.writer.drain()
+
+        status_line = await self._read_line()
+        while status_line.startswith("$") or not status_line:
+            status_line = await self._read_line()
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self._read_line()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+        length = int(response_headers.get("content-length", 0))
+        body = (await self.reader.readexactly(length)).decode() if length else ""
+        return status, response_headers, body
+
+    async def _read_line(self) -> str:
+        return (await self.reader.readline()).decode(errors="replace").rstrip("\r\n")
+
+    async def _open_udp_ports(self) -> int:
+        """Bind an even RTP port and the RTCP port above it; returns the RTP port."""
+        loop = asyncio.get_running_loop()
+        self._udp_queue = asyncio.Queue()
+        for _ in range(50):
+            rtp, _ = await loop.create_datagram_endpoint(
+                lambda: _RTPReceiver(self._udp_queue), local_addr=("0.0.0.0", 0))
+            port = rtp.get_extra_info("sockname")[1]
+            if port % 2 == 0:
+                try:
+                    rtcp, _ = await loop.create_datagram_endpoint(
+                        asyncio.DatagramProtocol, local_addr=("0.0.0.0", port + 1))
+                except OSError:
+                    rtcp = None
+                if rtcp:
+                    self._udp_transports = [rtp, rtcp]
+                    return port
+            rtp.close()
+        raise OSError("Could not bind a UDP port pair for RTP/RTCP")
+
+    async def _join_multicast(self, transport_header: str) -> None:
+        """Join the group from a multicast SETUP reply on the RTSP connection's interface."""
+        params = dict(p.partition("=")[::2] for p in transport_header.split(";"))
+        group = params.get("destination")
+        if not group or "port" not in params:
+            raise ConnectionError(f"SETUP reply lacks a multicast destination: {transport_header}")
+        port = int(params["port"].split("-")[0])
+        local_ip = self.writer.get_extra_info("sockname")[0]
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # Several viewers on one host share the group's port
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((group, port))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        socket.inet_aton(group) + socket.inet_aton(local_ip))
+        self._udp_queue = asyncio.Queue()
+        rtp, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _RTPReceiver(self._udp_queue), sock=sock)
+        self._udp_transports = [rtp]
+
+    async def play(self, transport: str = "tcp") -> None:
+        """DESCRIBE, SETUP the first video track and PLAY over `transport` (tcp/udp/multicast)."""
+        status, headers, sdp = await self.request("DESCRIBE", self.url, {"Accept": "application/sdp"})
+        if status != 200:
+            raise ConnectionError(f"DESCRIBE {self.url} failed with status {status}")
+        self.sdp = sdp
+        base = headers.get("content-base", self.url)
+        control = None
+        in_video = False
+        for line in sdp.splitlines():
+            if line.startswith("m="):
+                in_video = line.startswith("m=video")
+            elif in_video and line.startswith("a=control:"):
+                control = line[len("a=control:"):].strip()
+                break
+        track = base if control in (None, "*") else (
+            control if control.startswith("rtsp://") else base.rstrip("/") + "/" + control)
+
+        self.transport = transport
+        if transport == "udp":
+            port = await self._open_udp_ports()
+            spec = f"RTP/AVP;unicast;client_port={port}-{port + 1}"
+        elif transport == "multicast":
+            spec = "RTP/AVP;multicast"
+        else:
+            spec = "RTP/AVP/TCP;unicast;interleaved=0-1"
+        status, headers, _ = await self.request("SETUP", track, {"Transport": spec})
+        if status != 200:
+            raise ConnectionError(f"SETUP failed with status {status}")
+        self.session = headers.get("session", "").split(";")[0]
+        if transport == "multicast":
+            await self._join_multicast(headers.get("transport", ""))
+        status, _, _ = await self.request("PLAY", base, {"Range": "npt=0.000-"})
+        if status != 200:
+            raise ConnectionError(f"PLAY failed with status {status}")
+
+    async def record(self, sdp: str) -> None:
+        """ANNOUNCE `sdp`, SETUP its track for publishing and start RECORD."""
+        status, _, _ = await self.request(
+            "ANNOUNCE", self.url, {"Content-Type": "application/sdp"}, body=sdp)
+        if status != 200:
+            raise ConnectionError(f"ANNOUNCE {self.url} failed with status {status}")
+        status, headers, _ = await self.request(
+            "SETUP", self.url.rstrip("/") + "/trackID=0",
+            {"Transport": "RTP/AVP/TCP;unicast;interleaved=0-1;mode=record"})
+        if status != 200:
+            raise ConnectionError(f"SETUP failed with status {status}")
+        self.session = headers.get("session", "").split(";")[0]
+        status, _, _ = await self.request("RECORD", self.url, {"Range": "npt=0.000-"})
+        if status != 200:
+            raise ConnectionError(f"RECORD failed with status {status}")
+
+    def send_rtp(self, packet: bytes, channel: int = 0) -> None:
+        """Queue an RTP packet on an interleaved channel."""
+        self.writer.write(b"$" + bytes([channel]) + len(packet).to_bytes(2, "big") + packet)
+
+    async def read_packet(self) -> tuple:
+        """Return the next interleaved (channel, payload)."""
+        while True:
+            marker = await self.reader.readexactly(1)
+            if marker == b"$":
+                header = await self.reader.readexactly(3)
+                length = int.from_bytes(header[1:], "big")
+                return header[0], await self.reader.readexactly(length)
+            # Stray RTSP message (e.g. a keepalive response): skip its headers
+            await self.reader.readuntil(b"\r\n\r\n")
+
+    async def read_rtp(self) -> bytes:
+        """Return the next RTP packet on the video channel."""
+        if self.transport in ("udp", "multicast"):
+            return await self._udp_queue.get()
+        while True:
+            channel, payload = await self.read_packet()
+            if channel == 0:
+                return payload
+
+    async def close(self) -> None:
+        for udp in self._udp_transports:
+            udp.close()
+        if self.writer:
+            self.writer.close()
+            with contextlib.suppress(Exception):
+                await self.writer.wait_closed()
+
+
+# Marks the SEI messages that carry latency benchmark timestamps
+LATENCY_SEI_UUID = b"rpi-rtsp-latency"
+
+
+class _BitWriter:
+    """Bit-level writer for H.264 parameter sets (Exp-Golomb codes)."""
+
+    def __init__(self):
+        self.bits: list = []
+
+    def u(self, value: int, count: int) -> None:
+        self.bits.extend((value >> i) & 1 for i in reversed(range(count)))
+
+    def ue(self, value: int) -> None:
+        value += 1
+        self.u(0, value.bit_length() - 1)
+        self.u(value, value.bit_length())
+
+    def se(self, value: int) -> None:
+        self.ue(2 * value - 1 if value > 0 else -2 * value)
+
+    def rbsp(self) -> bytes:
+        """Bytes with RBSP trailing bits and emulation prevention applied."""
+        bits = self.bits + [1] + [0] * (-(len(self.bits) + 1) % 8)
+        raw = bytes(int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8))
+        escaped = bytearray()
+        zeros = 0
+        for byte in raw:
+            if zeros >= 2 and byte <= 3:
+                escaped.append(3)
+                zeros = 0
+            escaped.append(byte)
+            zeros = zeros + 1 if byte == 0 else 0
+        return bytes(escaped)
+
+
+def h264_parameter_sets(width: int, height: int) -> tuple:
+    """Constrained-baseline SPS and PPS NAL units for a `width`x`height` stream."""
+    mbs_w, mbs_h = -(-width // 16), -(-height // 16)
+    sps = _BitWriter()
+    sps.u(66, 8)  # profile_idc: baseline
+    sps.u(0b11000000, 8)  # constraint_set0/1 flags
+    sps.u(41, 8)  # level_idc
+    sps.ue(0)  # seq_parameter_set_id
+    sps.ue(0)  # log2_max_frame_num_minus4
+    sps.ue(2)  # pic_order_cnt_type
+    sps.ue(1)  # max_num_ref_frames
+    sps.u(0, 1)  # gaps_in_frame_num_value_allowed_flag
+    sps.ue(mbs_w - 1)
+    sps.ue(mbs_h - 1)
+    sps.u(1, 1)  # frame_mbs_only_flag
+    sps.u(1, 1)  # direct_8x8_inference_flag
+    crop_right, crop_bottom = (mbs_w * 16 - width) // 2, (mbs_h * 16 - height) // 2
+    sps.u(int(bool(crop_right or crop_bottom)), 1)
+    if crop_right or crop_bottom:
+        for offset in (0, crop_right, 0, crop_bottom):
+            sps.ue(offset)
+    sps.u(0, 1)  # vui_parameters_present_flag
+
+    pps = _BitWriter()
+    pps.ue(0)  # pic_parameter_set_id
+    pps.ue(0)  # seq_parameter_set_id
+    pps.u(0, 1)  # entropy_coding_mode_flag: CAVLC
+    pps.u(0, 1)  # bottom_field_pic_order_in_frame_present_flag
+    pps.ue(0)  # num_slice_groups_minus1
+    pps.ue(0)  # num_ref_idx_l0_default_active_minus1
+    pps.ue(0)  # num_ref_idx_l1_default_active_minus1
+    pps.u(0, 1)  # weighted_pred_flag
+    pps.u(0, 2)  # weighted_bipred_idc
+    pps.se(0)  # pic_init_qp_minus26
+    pps.se(0)  # pic_init_qs_minus26
+    pps.se(0)  # chroma_qp_index_offset
+    pps.u(1, 1)  # deblocking_filter_control_present_flag
+    pps.u(0, 1)  # constrained_intra_pred_flag
+    pps.u(0, 1)  # redundant_pic_cnt_present_flag
+    return b"\x67" + sps.rbsp(), b"\x68" + pps.rbsp()
+
+
+def synthetic_h264_sdp(width: int, height: int) -> str:
+    """SDP announcing the synthetic H.264 track."""
+    sps, pps = h264_parameter_sets(width, height)
+    sprop = ",".join(base64.b64encode(nal).decode() for nal in (sps, pps))
+    return (
+        "v=0\r\n"
+        "o=- 0 0 IN IP4 127.0.0.1\r\n"
+        "s=rpi-rtsp synthetic source\r\n"
+        "c=IN IP4 127.0.0.1\r\n"
+        "t=0 0\r\n"
+        "m=video 0 RTP/AVP 96\r\n"
+        "a=rtpmap:96 H264/90000\r\n"
+        f"a=fmtp:96 packetization-mode=1; profile-level-id={sps[1:4].hex()}; "
+        f"sprop-parameter-sets={sprop}\r\n"
+        "a=control:trackID=0\r\n"
+    )
+
+
+def synthetic_access_unit(index: int, width: int, height: int, frame_bytes: int,
+                          idr_period: int) -> list:
+    """NAL units for one synthetic frame, led by an SEI carrying the send time.
+
+    Slice payloads are filler: MediaMTX relays H.264 without decoding it.
+    """
+    stamp = b"%016x" % time.time_ns()
+    sei = b"\x06\x05" + bytes([len(LATENCY_SEI_UUID) + len(stamp)]) + LATENCY_SEI_UUID + stamp + b"\x80"
+    if index % idr_period == 0:
+        return [sei, *h264_parameter_sets(width, height), b"\x65" + b"\x88" * frame_bytes]
+    return [sei, b"\x41" + b"\x9a" * frame_bytes]
+
+
+def rtp_packetize(nals: list, seq: int, timestamp: int, ssrc: int, mtu: int = 1400,
+                  marker: bool = True) -> list:
+    """RTP packets (RFC 6184: single NAL or FU-A) for one access unit.
+
+    Pass marker=False when sending part of an access unit, so its last packet
+    doesn't carry the end-of-frame marker bit.
+    """
+    payloads = []
+    for nal in nals:
+        if len(nal) <= mtu:
+            payloads.append((b"", nal))
+            continue
+        indicator = (nal[0] & 0xE0) | 28
+        for offset in range(1, len(nal), mtu):
+            first, last = offset == 1, offset + mtu >= len(nal)
+            fu_header = (0x80 if first else 0) | (0x40 if last else 0) | (nal[0] & 0x1F)
+            payloads.append((bytes([indicator, fu_header]), nal[offset:offset + mtu]))
+    packets = []
+    for i, (prefix, payload) in enumerate(payloads):
+        mark = 0x80 if marker and i == len(payloads) - 1 else 0
+        header = struct.pack("!BBHII", 0x80, mark | 96, (seq + i) & 0xFFFF, timestamp & 0xFFFFFFFF, ssrc)
+        packets.append(header + prefix + payload)
+    return packets
+
+
+def rtp_payload(packet: bytes) -> bytes:
+    """Payload of an RTP packet (skips CSRCs and header extension)."""
+    offset = 12 + 4 * (packet[0] & 0x0F)
+    if packet[0] & 0x10:
+        offset += 4 + 4 * int.from_bytes(packet[offset + 2:offset + 4], "big")
+    return packet[offset:]
+
+
+def sdp_parameter_sets(sdp: str) -> list:
+    """SPS/PPS NAL units from an SDP's sprop-parameter-sets."""
+    match = re.search(r"sprop-parameter-sets=([A-Za-z0-9+/=,]+)", sdp)
+    if not match:
+        return []
+    return [base64.b64decode(value) for value in match.group(1).split(",") if value]
+
+
+class H264Depacketizer:
+    """Reassembles RTP packets (RFC 6184) into access units.
+
+    push() returns the frames a packet completes (marker bit or a new
+    timestamp) as (nals, keyframe) pairs. Frames with lost packets are discarded. Keyframes get the
+    SDP's SPS/PPS prepended when the stream doesn't carry them in-band.
+    """
+
+    def __init__(self, parameter_sets: Optional[list] = None):
+        self.parameter_sets = parameter_sets or []
+        self.nals: list = []
+        self.timestamp: Optional[int] = None
+        self.lost = False
+        self._fragment: Optional[bytearray] = None
+        self._seq: Optional[int] = None
+
+    def _finish(self) -> Optional[tuple]:
+        nals, lost = self.nals, self.lost
+        self.nals, self.lost, self._fragment = [], False, None
+        if not nals or lost:
+            return None
+        types = {nal[0] & 0x1F for nal in nals}
+        keyframe = 5 in types
+        if keyframe and 7 not in types:
+            nals = self.parameter_sets + nals
+        return nals, keyframe
+
+    def push(self, packet: bytes) -> list:
+        seq, timestamp = struct.unpack_from("!HI", packet, 2)
+        done = []
+        if timestamp != self.timestamp:
+            done.append(self._finish())
+            self.timestamp = timestamp
+        if self._seq is not None and seq != (self._seq + 1) & 0xFFFF:
+            self.lost = True
+        self._seq = seq
+
+        payload = rtp_payload(packet)
+        nal_type = payload[0] & 0x1F if payload else 0
+        if 1 <= nal_type <= 23:
+            self.nals.append(payload)
+        elif nal_type == 24:  # STAP-A
+            pos = 1
+            while pos + 2 <= len(payload):
+                size = int.from_bytes(payload[pos:pos + 2], "big")
+                self.nals.append(payload[pos + 2:pos + 2 + size])
+                pos += 2 + size
+        elif nal_type == 28 and len(payload) > 2:  # FU-A
+            if payload[1] & 0x80:
+                self._fragment = bytearray([(payload[0] & 0xE0) | (payload[1] & 0x1F)])
+            if self._fragment is None:
+                self.lost = True
+            else:
+                self._fragment += payload[2:]
+                if payload[1] & 0x40:
+                    self.nals.append(bytes(self._fragment))
+                    self._fragment = None
+
+        if packet[1] & 0x80:
+            done.append(self._finish())
+        return [unit for unit in done if unit]
+
+
+def parse_latency_stamp(packet: bytes) -> Optional[int]:
+    """Send time (ns) carried by a benchmark SEI in `packet`, if any."""
+    payload = rtp_payload(packet)
+    if not payload:
+        return None
+    nal_type = payload[0] & 0x1F
+    if nal_type == 24:  # STAP-A
+        nals, offset = [], 1
+        while offset + 2 <= len(payload):
+            size = int.from_bytes(payload[offset:offset + 2], "big")
+            nals.append(payload[offset + 2:offset + 2 + size])
+            offset += 2 + size
+    else:
+        nals = [payload]
+    for nal in nals:
+        if nal and nal[0] & 0x1F == 6:
+            start = nal.find(LATENCY_SEI_UUID)
+            if start >= 0:
+                stamp = nal[start + len(LATENCY_SEI_UUID):start + len(LATENCY_SEI_UUID) + 16]
+                with contextlib.suppress(ValueError):
+                    return int(stamp, 16)
+    return None
+
+
+async def publish_synthetic(client: RTSPClient, width: int, height: int, fps: int,
+                            bitrate: int, idr_period: int, duration: float) -> int:
+    """Publish timestamped synthetic frames at `fps` for `duration` seconds."""
+    frame_bytes = max(16, bitrate // 8 // fps)
+    ssrc = random.getrandbits(32)
+    seq = random.getrandbits(16)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    frames = int(duration * fps)
+    for index in range(frames):
+        await asyncio.sleep(max(0.0, start + index / fps - loop.time()))
+        nals = synthetic_access_unit(index, width, height, frame_bytes, idr_period)
+        packets = rtp_packetize(nals, seq, index * 90000 // fps, ssrc)
+        seq += len(packets)
+        for packet in packets:
+            client.send_rtp(packet)
+        await client.writer.drain()
+    return frames
+
+
+async def _measure_latency(url: str, stream: StreamDefinition, duration: float) -> list:
+    """Relay latencies (ms) of timestamped frames published to and read back from `url`."""
+    publisher = RTSPClient(url)
+    reader = RTSPClient(url)
+    await publisher.connect()
+    try:
+        await publisher.record(synthetic_h264_sdp(stream.width, stream.height))
+        publishing = asyncio.create_task(publish_synthetic(
+            publisher, stream.width, stream.height, stream.fps, stream.bitrate,
+            stream.idr_period, duration + 1.5))
+        await asyncio.sleep(0.5)
+        await reader.connect()
+        await reader.play()
+
+        latencies = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + duration
+        while loop.time() < deadline:
+            packet = await asyncio.wait_for(reader.read_rtp(), 5)
+            stamp = parse_latency_stamp(packet)
+            if stamp is not None:
+                latencies.append((time.time_ns() - stamp) / 1e6)
+        publishing.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await publishing
+        return latencies
+    finally:
+        await reader.close()
+        await publisher.close()
+
+
+class _BenchStreamer(RTSPStreamer):
+    """MediaMTX with a single publisher path, for the relay benchmarks."""
+
+    BENCH_PATH = "bench"
+    pid_path = RUNTIME_DIR / "rpi-rtsp-bench.pid"
+    config_prefix = "rpi-rtsp-bench"
+
+    def paths_settings(self) -> dict:
+        return {self.BENCH_PATH: {"source": "publisher"}}
+
+
+def _bench_config(config: StreamConfig, **overrides) -> StreamConfig:
+    """`config` moved to spare ports with every optional listener off, so a
+    benchmark MediaMTX can run next to the service."""
+    defaults = {"port": 18554, "api_port": 19997, "rtp_port": 18000, "wait_for_path": False,
+                "multicast": False, "webrtc": False, "srt": False, "srt_publish_url": "",
+                "hls": False}
+    return replace(config, **{**defaults, **overrides})
+
+
+@contextlib.contextmanager
+def _bench_server(config: StreamConfig, mediamtx_path: Optional[str], url: Optional[str],
+                  **overrides):
+    """Yield (URL of a publishable path, MediaMTX PID), launching MediaMTX unless
+    `url` is given (the PID is then None). `overrides` apply to the bench config."""
+    if url:
+        yield url, None
+        return
+    bench_config = _bench_config(config, **overrides)
+    streamer = _BenchStreamer(bench_config, mediamtx_path=mediamtx_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = streamer._start_mediamtx()
+    if not ok:
+        streamer._print_recent_output()
+        print("ERROR: Could not start MediaMTX for the benchmark")
+        sys.exit(1)
+    try:
+        yield (f"rtsp://127.0.0.1:{bench_config.port}/{_BenchStreamer.BENCH_PATH}",
+               streamer.mediamtx_proc.pid)
+    finally:
+        streamer._stop_mediamtx()
+
+
+def bench_latency(config: StreamConfig, mediamtx_path: Optional[str], url: Optional[str],
+                  fps_values: list, idr_values: list, bitrate_values: list,
+                  duration: float) -> None:
+    """Report relay latency percentiles for each fps/idr_period/bitrate combination.
+
+    A synthetic H.264 source stamps the wall-clock send time into an SEI NAL
+    unit of every frame; a local RTSP reader pulls the stream back through
+    MediaMTX and compares. Camera exposure and hardware encode time are not
+    included, so this measures what MediaMTX and the network stack add.
+    """
+    base = config.stream_definitions()[0]
+    print(f"{'fps':>4} {'idr':>4} {'bitrate':>9} {'frames':>7} {'p50':>8} {'p90':>8} "
+          f"{'p99':>8} {'max':>8}")
+    with _bench_server(config, mediamtx_path, url) as (bench_url, _):
+        for fps, idr_period, bitrate in itertools.product(fps_values, idr_values, bitrate_values):
+            stream = replace(base, fps=fps, idr_period=idr_period, bitrate=bitrate)
+            try:
+                latencies = asyncio.run(_measure_latency(bench_url, stream, duration))
+            except (OSError, ConnectionError, asyncio.TimeoutError,
+                    asyncio.IncompleteReadError) as e:
+                print(f"ERROR: Benchmark against {bench_url} failed: {e}")
+                sys.exit(1)
+            if not latencies:
+                print(f"{fps:>4} {idr_period:>4} {bitrate / 1e6:>8.1f}M {0:>7}  (no frames received)")
+                continue
+            print(f"{fps:>4} {idr_period:>4} {bitrate / 1e6:>8.1f}M {len(latencies):>7} "
+                  + " ".join(f"{_percentile(latencies, p):>6.2f}ms" for p in (50, 90, 99))
+                  + f" {max(latencies):>6.2f}ms")
+
+
+def _is_keyframe_packet(packet: bytes) -> bool:
+    """True if the RTP packet starts an IDR frame or carries an SPS."""
+    payload = rtp_payload(packet)
+    if not payload:
+        return False
+    nal_type = payload[0] & 0x1F
+    if nal_type == 28:  # FU-A: real type in the FU header, start fragment only
+        return len(payload) > 1 and bool(payload[1] & 0x80) and payload[1] & 0x1F == 5
+    if nal_type == 24:  # STAP-A
+        offset = 1
+        while offset + 2 < len(payload):
+            if payload[offset + 2] & 0x1F in (5, 7):
+                return True
+            offset += 2 + int.from_bytes(payload[offset:offset + 2], "big")
+        return False
+    return nal_type in (5, 7)
+
+
+async def _fanout_reader(url: str, transport: str, duration: float, fps: int) -> dict:
+    """Read `url` for `duration` seconds and summarise what arrived."""
+    client = RTSPClient(url)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    stats = {"transport": transport, "bytes": 0, "packets": 0, "frames": 0, "lost_packets": 0,
+             "first_keyframe_ms": None, "max_frame_gap_ms": 0.0, "late_frames": 0, "error": ""}
+    try:
+        await client.connect()
+        await client.play(transport)
+        deadline = loop.time() + duration
+        last_seq = None
+        last_frame = None
+        while loop.time() < deadline:
+            try:
+                packet = await asyncio.wait_for(client.read_rtp(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                break
+            now = loop.time()
+            stats["bytes"] += len(packet)
+            stats["packets"] += 1
+            seq = int.from_bytes(packet[2:4], "big")
+            if last_seq is not None:
+                stats["lost_packets"] += (seq - last_seq - 1) & 0xFFFF
+            last_seq = seq
+            if stats["first_keyframe_ms"] is None and _is_keyframe_packet(packet):
+                stats["first_keyframe_ms"] = (now - started) * 1000
+            if packet[1] & 0x80:  # Marker bit: last packet of a frame
+                stats["frames"] += 1
+                if last_frame is not None:
+                    gap = (now - last_frame) * 1000
+                    stats["max_frame_gap_ms"] = max(stats["max_frame_gap_ms"], gap)
+                    stats["late_frames"] += gap > 2000 / fps
+                last_frame = now
+    except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+        stats["error"] = str(e) or type(e).__name__
+    finally:
+        await client.close()
+    stats["throughput_bps"] = stats["bytes"] * 8 / duration
+    return stats
+
+
+async def _run_fanout(url: str, readers: int, transport: str, duration: float,
+                      stream: StreamDefinition, publish: bool) -> list:
+    """Run `readers` concurrent clients, publishing the synthetic source if asked."""
+    publisher = None
+    publishing = None
+    try:
+        if publish:
+            publisher = RTSPClient(url)
+            await publisher.connect()
+            await publisher.record(synthetic_h264_sdp(stream.width, stream.height))
+            publishing = asyncio.create_task(publish_synthetic(
+                publisher, stream.width, stream.height, stream.fps, stream.bitrate,
+                stream.idr_period, duration + 2))
+            await asyncio.sleep(0.5)
+        return await asyncio.gather(*(
+            _fanout_reader(url, transport, duration, stream.fps) for _ in range(readers)))
+    finally:
+        if publishing:
+            publishing.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await publishing
+        if publisher:
+            await publisher.close()
+
+
+def bench_fanout(config: StreamConfig, mediamtx_path: Optional[str], url: Optional[str],
+                 reader_counts: list, transports: list, duration: float,
+                 report: Optional[Path]) -> None:
+    """Measure how MediaMTX copes as the number of concurrent readers grows.
+
+    Without --url, MediaMTX is launched with the synthetic source; with it,
+    an existing stream is read (and MediaMTX CPU is not measured).
+    """
+    stream = config.stream_definitions()[0]
+    summary = []
+    clients = []
+    print(f"{'transport':>9} {'readers':>7} {'mean Mbps':>9} {'min Mbps':>8} {'ttfk p50':>9} "
+          f"{'ttfk max':>9} {'max gap':>8} {'lost':>6} {'cpu':>6}")
+    with _bench_server(config, mediamtx_path, url) as (bench_url, pid):
+        for transport, readers in itertools.product(transports, reader_counts):
+            cpu_before = _read_process_stats(pid) if pid else None
+            started = time.monotonic()
+            results = asyncio.run(_run_fanout(bench_url, readers, transport, duration, stream,
+                                              publish=url is None))
+            elapsed = time.monotonic() - started
+            cpu_after = _read_process_stats(pid) if pid else None
+            cpu = (cpu_after[0] - cpu_before[0]) / elapsed if cpu_before and cpu_after else None
+
+            for index, result in enumerate(results):
+                clients.append({"readers": readers, "client": index, **result})
+            ok = [r for r in results if not r["error"]]
+            ttfk = [r["first_keyframe_ms"] for r in ok if r["first_keyframe_ms"] is not None]
+            row = {
+                "transport": transport,
+                "readers": readers,
+                "failed": len(results) - len(ok),
+                "mean_throughput_bps": sum(r["throughput_bps"] for r in ok) / max(1, len(ok)),
+                "min_throughput_bps": min((r["throughput_bps"] for r in ok), default=0),
+                "ttfk_p50_ms": _percentile(ttfk, 50) if ttfk else None,
+                "ttfk_max_ms": max(ttfk) if ttfk else None,
+                "max_frame_gap_ms": max((r["max_frame_gap_ms"] for r in ok), default=0),
+                "late_frames": sum(r["late_frames"] for r in ok),
+                "lost_packets": sum(r["lost_packets"] for r in ok),
+                "mediamtx_cpu": cpu,
+            }
+            summary.append(row)
+
+            def ms(value):
+                return "-" if value is None else f"{value:.0f}ms"
+            print(f"{transport:>9} {readers:>7} {row['mean_throughput_bps'] / 1e6:>9.2f} "
+                  f"{row['min_throughput_bps'] / 1e6:>8.2f} {ms(row['ttfk_p50_ms']):>9} "
+                  f"{ms(row['ttfk_max_ms']):>9} {ms(row['max_frame_gap_ms']):>8} "
+                  f"{row['lost_packets']:>6} {'-' if cpu is None else f'{cpu:.0%}':>6}"
+                  + (f"  ({row['failed']} failed)" if row["failed"] else ""))
+
+    if report:
+        if report.suffix == ".csv":
+            with open(report, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(summary[0]))
+                writer.writeheader()
+                writer.writerows(summary)
+        else:
+            with open(report, "w") as f:
+                json.dump({"url": url or "synthetic", "duration": duration,
+                           "fps": stream.fps, "bitrate": stream.bitrate,
+                           "summary": summary, "clients": clients}, f, indent=2)
+        print(f"Report written to {report}")
+
+
+async def _read_multicast(url: str, readers: int, duration: float) -> list:
+    """RTP sequence numbers each multicast reader received during `duration`."""
+    clients = [RTSPClient(url) for _ in range(readers)]
+    received = [[] for _ in clients]
+
+    async def collect(client, seqs):
+        while True:
+            packet = await client.read_rtp()
+            seqs.append(struct.unpack("!H", packet[2:4])[0])
+
+    try:
+        for client in clients:
+            await client.connect()
+            await client.play("multicast")
+        tasks = [asyncio.ensure_future(collect(c, r)) for c, r in zip(clients, received)]
+        await asyncio.sleep(duration)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for client in clients:
+            await client.close()
+    return received
+
+
+def bench_multicast(config: StreamConfig, url: Optional[str], readers: int,
+                    duration: float) -> None:
+    """Check that multicast readers all receive the same single copy of the stream.
+
+    Without --url, the built-in server is fed synthetic frames and sends to
+    the group over loopback, so this runs without a camera or network.
+    """
+    stream = config.stream_definitions()[0]
+    server = feeder = None
+    stop = threading.Event()
+    if url is None:
+        target = MulticastTarget(str(ipaddress.IPv4Network(config.multicast_ip_range,
+                                                            strict=False).network_address + 1),
+                                 18002, 18003, ttl=0, interface="127.0.0.1")
+        read_fd, write_fd = os.pipe()
+        server = H264RTSPServer(os.fdopen(read_fd, "rb", buffering=0), stream.path, 18554,
+                                stream.fps, 1 << 20, multicast=target, rtp_port=18000)
+
+        def feed():
+            frame_bytes = stream.bitrate // 8 // stream.fps
+            with os.fdopen(write_fd, "wb", buffering=0) as out:
+                for index in itertools.count():
+                    if stop.wait(1 / stream.fps):
+                        break
+                    nals = synthetic_access_unit(index, stream.width, stream.height,
+                                                 frame_bytes, stream.idr_period)
+                    out.write(b"".join(b"\x00\x00\x00\x01" + nal for nal in nals))
+
+        if not server.start():
+            print("ERROR: Built-in server did not start")
+            sys.exit(1)
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        url = f"rtsp://127.0.0.1:18554/{stream.path}"
+
+    try:
+        results = asyncio.run(_read_multicast(url, readers, duration))
+    finally:
+        stop.set()
+        if server:
+            server.stop()
+
+    # Readers joined at slightly different times: compare the window all of them saw
+    common = set.intersection(*(set(seqs) for seqs in results)) if all(results) else set()
+    print(f"{'reader':>6} {'packets':>8} {'lost':>6}")
+    for index, seqs in enumerate(results):
+        span = (seqs[-1] - seqs[0]) % 65536 + 1 if seqs else 0
+        print(f"{index:>6} {len(seqs):>8} {span - len(set(seqs)):>6}")
+    identical = bool(common) and all(
+        [seq for seq in seqs if seq in common] == [seq for seq in results[0] if seq in common]
+        for seqs in results)
+    print(f"{len(common)} packets seen by all {readers} readers; "
+          f"sequences {'identical' if identical else 'DIFFER'}")
+    if server:
+        print(f"Server sent {server.multicast_packets} multicast packets "
+              f"(one copy for {readers} readers)")
+    if not identical:
+        sys.exit(1)
+
+
+class UDPImpairmentProxy:
+    """Relays UDP between one client and `upstream`, dropping and delaying datagrams.
+
+    Stands in for a lossy long-haul link (netem without root): each datagram,
+    in either direction, is dropped with probability `loss` and otherwise
+    delivered after `delay` plus up to `jitter` seconds, so it may overtake
+    its neighbours. Runs its own event loop in a thread.
+    """
+
+    def __init__(self, upstream: tuple, loss: float = 0.0, delay: float = 0.0,
+                 jitter: float = 0.0, seed: Optional[int] = None):
+        self.upstream = upstream
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.port = 0
+        self.forwarded = 0
+        self.dropped = 0
+        self._random = random.Random(seed)
+        self._client = None
+        self._listen = None
+        self._relay = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="udp-impair", daemon=True)
+
+    def start(self) -> int:
+        """Start relaying; returns the local port clients should send to."""
+        self._thread.start()
+        self._ready.wait(5)
+        return self.port
+
+    def stop(self) -> None:
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    def _forward(self, transport, data: bytes, addr) -> None:
+        if self._random.random() < self.loss:
+            self.dropped += 1
+            return
+        self.forwarded += 1
+        delay = self.delay + self._random.random() * self.jitter
+        if delay > 0:
+            self._loop.call_later(delay, transport.sendto, data, addr)
+        else:
+            transport.sendto(data, addr)
+
+    def _run(self) -> None:
+        proxy = self
+        self._loop = asyncio.new_event_loop()
+
+        class FromClient(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                proxy._client = addr
+                proxy._forward(proxy._relay, data, proxy.upstream)
+
+        class FromUpstream(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                if proxy._client:
+                    proxy._forward(proxy._listen, data, proxy._client)
+
+        try:
+            self._listen, _ = self._loop.run_until_complete(self._loop.create_datagram_endpoint(
+                FromClient, local_addr=("127.0.0.1", 0)))
+            self._relay, _ = self._loop.run_until_complete(self._loop.create_datagram_endpoint(
+                FromUpstream, local_addr=("127.0.0.1", 0)))
+            self.port = self._listen.get_extra_info("sockname")[1]
+            self._ready.set()
+            self._loop.run_forever()
+        finally:
+            for transport in (self._listen, self._relay):
+                if transport:
+                    transport.close()
+            self._loop.run_until_complete(asyncio.sleep(0))
+            self._loop.close()
+            self._ready.set()
+
+
+def _count_intact_frames(stream, frame_bytes: int) -> tuple:
+    """Read an Annex B stream of synthetic frames; returns (intact frames, first stamp, last stamp).
+
+    A frame is intact when its SEI stamp arrived and the slice after it has
+    exactly the size the publisher sent (no lost or concealed data).
+    """
+    intact = set()
+    stamps = []
+    pending = None
+    buffer = b""
+    for chunk in itertools.chain(iter(lambda: stream.read(65536), b""), [None]):
+        if chunk is None:  # End of stream: the last NAL unit is complete
+            nals, buffer = buffer.split(b"\x00\x00\x01"), b""
+        else:
+            buffer += chunk
+            nals = buffer.split(b"\x00\x00\x01")
+            buffer = b"\x00\x00\x01" + nals.pop()
+        for nal in nals:
+            nal = nal.rstrip(b"\x00")
+            if not nal:
+                continue
+            nal_type = nal[0] & 0x1F
+            if nal_type == 6 and LATENCY_SEI_UUID in nal:
+                start = nal.find(LATENCY_SEI_UUID) + len(LATENCY_SEI_UUID)
+                with contextlib.suppress(ValueError):
+                    pending = int(nal[start:start + 16], 16)
+                    stamps.append(pending)
+            elif nal_type in (1, 5):
+                if pending is not None and len(nal) == frame_bytes + 1:
+                    intact.add(pending)
+                pending = None
+    return len(intact), min(stamps, default=None), max(stamps, default=None)
+
+
+def bench_srt(config: StreamConfig, mediamtx_path: Optional[str], latencies: list,
+              losses: list, delay: float, duration: float) -> None:
+    """Recovered-frame ratio of an SRT reader behind a lossy link, per latency window.
+
+    A synthetic stream is published to MediaMTX over RTSP and read back over
+    SRT by ffmpeg through a UDPImpairmentProxy. A frame counts as recovered
+    if it arrives complete; SRT drops what it can't retransmit within the
+    latency window. Needs the real MediaMTX and an ffmpeg built with libsrt.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        print("ERROR: ffmpeg (with libsrt) is needed to read SRT")
+        sys.exit(1)
+    stream = config.stream_definitions()[0]
+    frame_bytes = max(16, stream.bitrate // 8 // stream.fps)
+    bench_config = _bench_config(config, srt=True, srt_port=18890, srt_passphrase="")
+    print(f"one-way delay {delay * 1000:.0f} ms, {stream.fps} fps, "
+          f"{stream.bitrate / 1e6:g} Mbps, {duration:g} s per run")
+    print(f"{'latency':>8} {'loss':>6} {'frames':>7} {'recovered':>9} {'dropped':>8}")
+    with _bench_server(config, mediamtx_path, None, srt=True, srt_port=18890,
+                       srt_passphrase="") as (bench_url, _):
+        for latency, loss in itertools.product(latencies, losses):
+            proxy = UDPImpairmentProxy(("127.0.0.1", bench_config.srt_port), loss, delay,
+                                       jitter=delay / 5, seed=1)
+            port = proxy.start()
+            reader_url = replace(bench_config, srt_latency=latency).srt_url(
+                f"srt://127.0.0.1:{port}", f"read:{_BenchStreamer.BENCH_PATH}")
+
+            errors = []
+
+            async def publish():
+                publisher = RTSPClient(bench_url)
+                try:
+                    await publisher.connect()
+                    await publisher.record(synthetic_h264_sdp(stream.width, stream.height))
+                    await publish_synthetic(publisher, stream.width, stream.height, stream.fps,
+                                            stream.bitrate, stream.idr_period, duration + 2)
+                except (OSError, ConnectionError, asyncio.IncompleteReadError) as e:
+                    errors.append(e)
+                finally:
+                    await publisher.close()
+
+            publisher = threading.Thread(target=asyncio.run, args=(publish(),), daemon=True)
+            publisher.start()
+            time.sleep(0.5)
+            reader = subprocess.Popen(
+                [ffmpeg, "-nostdin", "-hide_banner", "-loglevel", "error", "-i", reader_url,
+                 "-t", f"{duration:g}", "-c", "copy", "-f", "h264", "-"],
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            try:
+                intact, first, last = _count_intact_frames(reader.stdout, frame_bytes)
+            finally:
+                with contextlib.suppress(subprocess.TimeoutExpired):
+                    reader.wait(timeout=duration + 5)
+                if reader.poll() is None:
+                    reader.kill()
+                publisher.join()
+                proxy.stop()
+
+            if errors:
+                print(f"{latency:>6}ms {loss:>6.1%}  publishing failed: {errors[0]}")
+                print("ERROR: Could not publish the synthetic stream to MediaMTX")
+                sys.exit(1)
+            sent = round((last - first) * stream.fps / 1e9) + 1 if first is not None else 0
+            ratio = f"{intact / sent:.1%}" if sent else "-"
+            print(f"{latency:>6}ms {loss:>6.1%} {sent:>7} {ratio:>9} {proxy.dropped:>8}")
+
+
+async def _time_first_frame(url: str, timeout: float) -> float:
+    """Seconds from connecting until the first RTP packet arrives."""
+    client = RTSPClient(url)
+    start = time.perf_counter()
+    try:
+        await client.connect()
+        await client.play()
+        await asyncio.wait_for(client.read_rtp(), timeout)
+        return time.perf_counter() - start
+    finally:
+        await client.close()
+
+
+def bench_first_frame(config: StreamConfig, url: Optional[str], runs: int,
+                      idle: Optional[float]) -> None:
+    """Measure time to first frame for a reader of a running stream.
+
+    With on_demand enabled, waiting longer than on_demand_close_after between
+    runs makes every run a cold camera start.
+    """
+    stream = config.stream_definitions()[0]
+    url = url or f"rtsp://127.0.0.1:{config.port}/{stream.path}"
+    idle = stream.on_demand_close_after + 2 if idle is None else idle
+    samples = []
+    for run in range(runs):
+        if run:
+            time.sleep(idle)
+        try:
+            elapsed = asyncio.run(_time_first_frame(url, stream.on_demand_start_timeout + 5))
+        except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            print(f"ERROR: Could not read {url}: {e}")
+            sys.exit(1)
+        samples.append(elapsed * 1000)
+        print(f"  run {run + 1}: {samples[-1]:.0f} ms")
+
+    print(f"Time to first frame over {runs} runs ({url}, {idle:g}s idle between runs):")
+    for pct in (50, 90):
+        print(f"  p{pct}: {_percentile(samples, pct):.0f} ms")
+    print(f"  max: {max(samples):.0f} ms")
+
+
+def _synthetic_link_trace() -> list:
+    """(capacity_bps, loss) per step for a link that degrades and recovers."""
+    trace = []
+    for step in range(120):
+        if step < 30:
+            trace.append((8000000, 0.0))
+        elif step < 60:
+            trace.append((2500000, 0.03))
+        elif step < 75:
+            trace.append((1200000, 0.12))
+        else:
+            trace.append((6000000, 0.005))
+    return trace
+
+
+def _load_link_trace(path: Path) -> list:
+    """Read a CSV trace with columns capacity_bps and loss (one row per sample)."""
+    with open(path, newline="") as f:
+        return [(float(row["capacity_bps"]), float(row["loss"])) for row in csv.DictReader(f)]
+
+
+def _trace_sample(bitrate: int, capacity: float, random_loss: float) -> DeliverySample:
+    """What readers see when `bitrate` meets a trace step: the link delivers at
+    most `capacity`, and the excess counts as lost on top of `random_loss`."""
+    delivered = min(1.0, capacity / bitrate)
+    return DeliverySample(loss=1 - delivered * (1 - random_loss), delivery=delivered)
+
+
+def bench_abr(config: StreamConfig, trace_path: Optional[Path], verbose: bool) -> None:
+    """Replay a link trace through the adaptive bitrate controller.
+
+    Each step models a link that delivers at most `capacity_bps`; anything
+    the encoder produces beyond that counts as lost, on top of the trace's
+    random loss.
+    """
+    trace = _load_link_trace(trace_path) if trace_path else _synthetic_link_trace()
+    stream = config.stream_definitions()[0]
+    controller = BitrateController(
+        stream.bitrate, stream.idr_period, config.abr_min_bitrate,
+        config.abr_max_bitrate or stream.bitrate, config.abr_min_idr_period,
+    )
+
+    changes = 0
+    overshoot_steps = 0
+    delivered_bits = 0.0
+    if verbose:
+        print(f"{'step':>5} {'capacity':>10} {'loss':>6} {'bitrate':>10} {'idr':>4}")
+    for step, (capacity, random_loss) in enumerate(trace):
+        sample = _trace_sample(controller.bitrate, capacity, random_loss)
+        overshoot_steps += sample.delivery < 1.0
+        delivered_bits += controller.bitrate * (1 - sample.loss)
+        changes += controller.update(sample)
+        if verbose:
+            print(f"{step:>5} {capacity / 1e6:>8.2f}M {sample.loss:>6.1%} "
+                  f"{controller.bitrate / 1e6:>8.2f}M {controller.idr_period:>4}")
+
+    print(f"ABR replay over {len(trace)} samples ({trace_path or 'built-in trace'}):")
+    print(f"  mean goodput: {delivered_bits / len(trace) / 1e6:.2f} Mbps")
+    print(f"  over capacity: {overshoot_steps / len(trace):.0%} of samples")
+    print(f"  setting changes: {changes}")
+    print(f"  final bitrate: {controller.bitrate / 1e6:.2f} Mbps, idr_period {controller.idr_period}")
+
+
+def bench_startup(config: StreamConfig, runs: int, mediamtx_path: Optional[str]) -> None:
+    """Report MediaMTX time-to-ready percentiles over repeated starts.
+
+    Runs on the bench ports and files with a publisher path, so a running
+    service (and its camera) is left alone.
+    """
+    bench_config = _bench_config(config)
+    with tempfile.TemporaryDirectory() as tmp:
+        binary = mediamtx_path or _write_fake_mediamtx(tmp)
+        samples = []
+        for _ in range(runs):
+            streamer = _BenchStreamer(bench_config, mediamtx_path=binary)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                ok = streamer._start_mediamtx()
+            elapsed = time.perf_counter() - start
+            streamer._stop_mediamtx()
+            if not ok:
+                print("ERROR: MediaMTX failed to start during benchmark")
+                sys.exit(1)
+            samples.append(elapsed * 1000)
+
+    print(f"Startup time-to-ready over {runs} runs ({binary}):")
+    for pct in (50, 90, 99):
+        print(f"  p{pct}: {_percentile(samples, pct):.1f} ms")
+    print(f"  max: {max(samples):.1f} ms")
+
+
+def _int_list(text: str) -> list:
+    return [int(value) for value in text.split(",") if value]
+
+
+def _float_list(text: str) -> list:
+    return [float(value) for value in text.split(",") if value]
+
+
+def parse_args(argv: Optional[list] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="RTSP streamer for Raspberry Pi cameras")
+    parser.add_argument("--config", type=Path, default=CONFIG_PATH, help="config file path")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="also time the first RTP packet in each startup timeline")
+    subparsers = parser.add_subparsers(dest="command")
+
+    bench = subparsers.add_parser("bench", help="run a benchmark instead of streaming")
+    bench_modes = bench.add_subparsers(dest="bench", required=True)
+    startup = bench_modes.add_parser("startup", help="MediaMTX time-to-ready percentiles")
+    startup.add_argument("--runs", type=int, default=20)
+    startup.add_argument("--mediamtx", help="binary to benchmark (default: built-in stand-in)")
+    first_frame = bench_modes.add_parser(
+        "first-frame", help="time to first frame for a reader of the running stream")
+    first_frame.add_argument("--url", help="stream URL (default: first configured path on localhost)")
+    first_frame.add_argument("--runs", type=int, default=5)
+    latency = bench_modes.add_parser(
+        "latency", help="relay latency percentiles per fps/idr_period/bitrate")
+    latency.add_argument("--mediamtx", help="MediaMTX binary (default: the installed one)")
+    latency.add_argument("--url", help="publish to this RTSP URL instead of launching MediaMTX")
+    latency.add_argument("--fps", type=_int_list, help="comma-separated (default: config)")
+    latency.add_argument("--idr-period", type=_int_list, help="comma-separated (default: config)")
+    latency.add_argument("--bitrate", type=_int_list, help="comma-separated (default: config)")
+    latency.add_argument("--duration", type=float, default=5.0, help="seconds per combination")
+    fanout = bench_modes.add_parser("fanout", help="many concurrent readers against one server")
+    fanout.add_argument("--mediamtx", help="MediaMTX binary (default: the installed one)")
+    fanout.add_argument("--url", help="read this RTSP URL instead of launching MediaMTX")
+    fanout.add_argument("--readers", type=_int_list, default=[1, 4, 8, 12, 16, 20],
+                        help="comma-separated reader counts")
+    fanout.add_argument("--transport", default="tcp,udp", help="comma-separated: tcp, udp")
+    fanout.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    fanout.add_argument("--report", type=Path, help="write a .json or .csv report")
+    multicast = bench_modes.add_parser("multicast", help="several readers of one multicast group")
+    multicast.add_argument("--url", help="read this RTSP URL instead of a loopback built-in server")
+    multicast.add_argument("--readers", type=int, default=4)
+    multicast.add_argument("--duration", type=float, default=5.0)
+    srt = bench_modes.add_parser("srt", help="SRT recovered frames vs latency window on a lossy link")
+    srt.add_argument("--mediamtx", help="MediaMTX binary (default: the installed one)")
+    srt.add_argument("--latency", type=_int_list, default=[80, 200, 500, 1000],
+                     help="comma-separated latency windows (ms)")
+    srt.add_argument("--loss", type=_float_list, default=[0.01, 0.05, 0.1],
+                     help="comma-separated packet loss ratios, applied in both directions")
+    srt.add_argument("--delay", type=float, default=50.0, help="one-way link delay (ms)")
+    srt.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    abr = bench_modes.add_parser("abr", help="replay a link trace through the bitrate controller")
+    abr.add_argument("--trace", type=Path, help="CSV with capacity_bps,loss columns")
+    abr.add_argument("--verbose", action="store_true", help="print every step")
+    first_frame.add_argument("--idle", type=float,
+                             help="seconds between runs (default: on_demand_close_after + 2)")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    timeline = StartupTimeline()
+
+    # Load configuration
+    with timeline.phase("config_load"):
+        config = StreamConfig.load(args.config)
+
+    if args.command == "bench":
+        if args.bench == "startup":
+            bench_startup(config, args.runs, args.mediamtx)
+        elif args.bench == "first-frame":
+            bench_first_frame(config, args.url, args.runs, args.idle)
+        elif args.bench == "latency":
+            bench_latency(config, args.mediamtx, args.url,
+                          args.fps or [config.fps], args.idr_period or [config.idr_period],
+                          args.bitrate or [config.bitrate], args.duration)
+        elif args.bench == "fanout":
+            bench_fanout(config, args.mediamtx, args.url, args.readers,
+                         args.transport.split(","), args.duration, args.report)
+        elif args.bench == "multicast":
+            bench_multicast(config, args.url, args.readers, args.duration)
+        elif args.bench == "srt":
+            bench_srt(config, args.mediamtx, args.latency, args.loss, args.delay / 1000,
+                      args.duration)
+        elif args.bench == "abr":
+            bench_abr(config, args.trace, args.verbose)
+        return
+
+    # Create streamer
+    streamer = RTSPStreamer(config, config_path=args.config, timeline=timeline,
+                            profile_startup=args.profile_startup)
+
+    # Set up signal handlers for graceful shutdown
+    def signal_handler(sig, frame):
+        streamer.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    # `kill -USR1 <pid>` marks an event on every path
+    signal.signal(signal.SIGUSR1, lambda sig, frame: streamer.trigger_event())
+
+    # Start streaming
+    if not streamer.start():
+        print("Failed to start streaming")
+        sys.exit(1)
+
+    # Supervise the stream until it is stopped
+    healthy = streamer.wait()
+    streamer.stop()
+    if not healthy:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
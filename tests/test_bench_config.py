@@ -0,0 +1,26 @@
+"""Benchmark configs stay off the service's ports and listeners."""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stream import StreamConfig, _bench_config  # noqa: E402
+
+
+class BenchConfigTest(unittest.TestCase):
+    def test_moves_ports_and_turns_listeners_off(self):
+        config = _bench_config(StreamConfig(multicast=True, webrtc=True, srt=True, hls=True))
+        self.assertEqual((config.port, config.api_port, config.rtp_port), (18554, 19997, 18000))
+        self.assertFalse(config.multicast or config.webrtc or config.srt or config.hls)
+
+    def test_overrides_win_over_the_defaults(self):
+        config = _bench_config(StreamConfig(), srt=True, srt_port=18890, srt_passphrase="")
+        self.assertTrue(config.srt)
+        self.assertEqual(config.srt_port, 18890)
+        self.assertEqual(config.port, 18554)
+
+
+if __name__ == "__main__":
+    unittest.main()
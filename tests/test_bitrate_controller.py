@@ -0,0 +1,68 @@
+"""BitrateController replayed against recorded link traces (tests/traces/*.csv)."""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stream import BitrateController, DeliverySample, _load_link_trace, _trace_sample  # noqa: E402
+
+TRACES = Path(__file__).resolve().parent / "traces"
+BAD = DeliverySample(loss=0.1, delivery=0.8)
+GOOD = DeliverySample()
+
+
+def controller() -> BitrateController:
+    return BitrateController(bitrate=4000000, idr_period=30, min_bitrate=500000,
+                             max_bitrate=4000000, min_idr_period=5)
+
+
+def replay(abr: BitrateController, trace: str) -> list:
+    """(bitrate, idr_period) after every step of `trace`."""
+    history = []
+    for capacity, loss in _load_link_trace(TRACES / trace):
+        abr.update(_trace_sample(abr.bitrate, capacity, loss))
+        history.append((abr.bitrate, abr.idr_period))
+    return history
+
+
+class BitrateControllerTest(unittest.TestCase):
+    def test_steps_down_only_after_consecutive_bad_samples(self):
+        abr = controller()
+        for _ in range(BitrateController.DOWN_AFTER - 1):
+            self.assertFalse(abr.update(BAD))
+        self.assertTrue(abr.update(BAD))
+        self.assertLess(abr.bitrate, 4000000)
+
+    def test_steps_up_only_after_consecutive_good_samples(self):
+        abr = controller()
+        for _ in range(BitrateController.DOWN_AFTER):
+            abr.update(BAD)
+        lowered = abr.bitrate
+        for _ in range(BitrateController.UP_AFTER - 1):
+            self.assertFalse(abr.update(GOOD))
+        self.assertTrue(abr.update(GOOD))
+        self.assertGreater(abr.bitrate, lowered)
+
+    def test_degrading_link_stays_within_bounds(self):
+        abr = controller()
+        bitrates = [bitrate for bitrate, _ in replay(abr, "link-degrade.csv")]
+        self.assertTrue(all(abr.min_bitrate <= bitrate <= abr.max_bitrate for bitrate in bitrates))
+        # The lossy 1.5 Mbps patch (steps 20-39) pushes the bitrate under its capacity
+        self.assertLessEqual(bitrates[39], 1500000)
+        self.assertEqual(bitrates[-1], abr.max_bitrate)
+
+    def test_idr_period_shortens_under_loss_and_is_restored(self):
+        idr_periods = [idr for _, idr in replay(controller(), "link-degrade.csv")]
+        self.assertEqual(idr_periods[19], 30)
+        self.assertEqual(min(idr_periods[20:40]), 5)
+        self.assertEqual(idr_periods[-1], 30)
+
+    def test_noisy_link_does_not_oscillate(self):
+        history = replay(controller(), "link-noisy.csv")
+        self.assertEqual(set(history), {(4000000, 30)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""LogPump keeps a chatty child from blocking on a full stdout pipe."""
+
+import contextlib
+import io
+import subprocess
+import sys
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stream import LogPump  # noqa: E402
+
+# Far more output than the ~64 KiB pipe buffer holds
+FLOOD = "import sys\nfor i in range(200000):\n    sys.stdout.write(f'reader {i} connected\\n')\n"
+
+
+class LogPumpTest(unittest.TestCase):
+    def run_flood(self, rate: float):
+        proc = subprocess.Popen([sys.executable, "-c", FLOOD], stdout=subprocess.PIPE)
+        pump = LogPump(proc.stdout, max_lines=50, rate=rate, name="flood")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            started = time.monotonic()
+            pump.start()
+            proc.wait(timeout=30)
+            elapsed = time.monotonic() - started
+            pump.join(timeout=10)
+        proc.stdout.close()
+        return pump, output.getvalue(), elapsed
+
+    def test_flooding_child_never_stalls(self):
+        pump, _, elapsed = self.run_flood(rate=20)
+        self.assertLess(elapsed, 15)
+        self.assertEqual(pump.total, 200000)
+
+    def test_ring_buffer_keeps_last_lines(self):
+        pump, _, _ = self.run_flood(rate=20)
+        self.assertEqual(len(pump.tail()), 50)
+        self.assertEqual(pump.tail(1), ["reader 199999 connected"])
+
+    def test_rate_limit_reports_suppressed_lines(self):
+        pump, output, _ = self.run_flood(rate=20)
+        echoed = [line for line in output.splitlines() if "connected" in line]
+        suppressed = sum(int(line.split("(")[1].split()[0])
+                         for line in output.splitlines() if "lines suppressed" in line)
+        self.assertLess(len(echoed), 1000)
+        # Every line was either echoed or counted, including those after the last echo
+        self.assertEqual(len(echoed) + suppressed, 200000)
+        self.assertEqual(pump.suppressed, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
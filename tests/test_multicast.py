@@ -0,0 +1,102 @@
+"""Multicast readers on loopback all get the one copy the server sends."""
+
+import asyncio
+import os
+import struct
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stream import (H264RTSPServer, MulticastTarget, RTSPClient, StreamConfig,  # noqa: E402
+                    render_mediamtx_config, synthetic_access_unit)
+
+READERS = 3
+FRAMES = 30
+FPS = 30
+
+
+class BuiltInServerMulticastTest(unittest.TestCase):
+    def setUp(self):
+        read_fd, self.write_fd = os.pipe()
+        target = MulticastTarget("224.1.0.1", 28002, 28003, ttl=0, interface="127.0.0.1")
+        self.server = H264RTSPServer(os.fdopen(read_fd, "rb", buffering=0), "stream", 28554,
+                                     FPS, 1 << 20, multicast=target, rtp_port=28000)
+        if not self.server.start():
+            self.fail(f"Built-in server did not start: {self.server.error}")
+        self.addCleanup(self.server.stop)
+
+    def feed(self, playing: threading.Event) -> None:
+        """Write FRAMES synthetic frames, paced like a camera, then end the stream.
+
+        The first keyframe carries the SPS/PPS that DESCRIBE waits for; the
+        rest only follow once every reader is playing.
+        """
+        with os.fdopen(self.write_fd, "wb", buffering=0) as out:
+            for index in range(FRAMES):
+                if index == 1:
+                    playing.wait(5)
+                nals = synthetic_access_unit(index, 640, 480, 4000, 10)
+                out.write(b"".join(b"\x00\x00\x00\x01" + nal for nal in nals))
+                time.sleep(1 / FPS)
+
+    async def read_group(self) -> list:
+        clients = [RTSPClient("rtsp://127.0.0.1:28554/stream") for _ in range(READERS)]
+        received = [[] for _ in clients]
+
+        async def collect(client, seqs):
+            while True:
+                packet = await client.read_rtp()
+                seqs.append(struct.unpack("!H", packet[2:4])[0])
+
+        playing = threading.Event()
+        feeder = threading.Thread(target=self.feed, args=(playing,), daemon=True)
+        try:
+            for client in clients:
+                await client.connect()
+            feeder.start()
+            for client in clients:
+                await client.play("multicast")
+            playing.set()
+            tasks = [asyncio.ensure_future(collect(c, r)) for c, r in zip(clients, received)]
+            await asyncio.get_running_loop().run_in_executor(None, feeder.join)
+            await asyncio.sleep(0.5)  # Let the last packets arrive
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for client in clients:
+                await client.close()
+        return received
+
+    def test_readers_receive_identical_sequences_from_one_copy(self):
+        received = asyncio.run(self.read_group())
+        first = received[0]
+        self.assertTrue(first)
+        for seqs in received[1:]:
+            self.assertEqual(seqs, first)
+        # No gaps, and every packet went to the group once, not once per reader
+        self.assertEqual(len(first), (first[-1] - first[0]) % 65536 + 1)
+        self.assertEqual(self.server.multicast_packets, len(first))
+
+
+class MediaMTXMulticastConfigTest(unittest.TestCase):
+    def test_multicast_adds_the_protocol_and_group_settings(self):
+        rendered = render_mediamtx_config(StreamConfig(multicast=True, multicast_ip_range="239.1.0.0/16",
+                                                       multicast_rtp_port=9002,
+                                                       multicast_rtcp_port=9003))
+        self.assertIn('protocols:\n  - "udp"\n  - "multicast"\n  - "tcp"\n', rendered)
+        self.assertIn('multicastIPRange: "239.1.0.0/16"\n', rendered)
+        self.assertIn("multicastRTPPort: 9002\n", rendered)
+        self.assertIn("multicastRTCPPort: 9003\n", rendered)
+
+    def test_no_multicast_protocol_when_off(self):
+        rendered = render_mediamtx_config(StreamConfig())
+        self.assertIn('protocols:\n  - "udp"\n  - "tcp"\n', rendered)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+"""SnapshotCache reads a path only while snapshots are being requested."""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stream import H264RTSPServer, SnapshotCache, synthetic_access_unit  # noqa: E402
+
+FPS = 30
+FAKE_FFMPEG = "#!/bin/sh\ncat > /dev/null\nprintf JPEG\n"
+
+
+class SnapshotTapTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.ffmpeg = Path(tmp.name) / "ffmpeg"
+        self.ffmpeg.write_text(FAKE_FFMPEG)
+        self.ffmpeg.chmod(0o755)
+
+        read_fd, write_fd = os.pipe()
+        self.server = H264RTSPServer(os.fdopen(read_fd, "rb", buffering=0), "stream", 28654,
+                                     FPS, 1 << 20, rtp_port=28100)
+        if not self.server.start():
+            self.fail(f"Built-in server did not start: {self.server.error}")
+        stop = threading.Event()
+
+        def feed():
+            with os.fdopen(write_fd, "wb", buffering=0) as out:
+                index = 0
+                while not stop.wait(1 / FPS):
+                    nals = synthetic_access_unit(index, 640, 480, 2000, 10)
+                    out.write(b"".join(b"\x00\x00\x00\x01" + nal for nal in nals))
+                    index += 1
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(stop.set)
+
+    def wait_for_sessions(self, count: int, timeout: float = 5.0) -> int:
+        deadline = time.monotonic() + timeout
+        while len(self.server.sessions) != count and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return len(self.server.sessions)
+
+    def test_reads_only_while_requested(self):
+        cache = SnapshotCache("stream", 0.5, str(self.ffmpeg),
+                              tap_url="rtsp://127.0.0.1:28654/stream", start_timeout=5)
+        self.addCleanup(cache.close)
+        self.assertEqual(len(self.server.sessions), 0)
+
+        self.assertEqual(cache.get(), b"JPEG")
+        self.assertEqual(self.wait_for_sessions(1), 1)
+        # A request within the TTL is served from the cache, with no second decode
+        self.assertEqual(cache.get(), b"JPEG")
+        self.assertEqual(cache.decodes, 1)
+
+        # No requests for a TTL: the tap closes and the camera may stop
+        self.assertEqual(self.wait_for_sessions(0), 0)
+
+        time.sleep(0.6)
+        self.assertEqual(cache.get(), b"JPEG")
+        self.assertEqual(cache.decodes, 2)
+
+    def test_without_tap_url_it_never_connects(self):
+        cache = SnapshotCache("stream", 0.5, str(self.ffmpeg))
+        self.assertIsNone(cache.get())
+        time.sleep(0.2)
+        self.assertEqual(len(self.server.sessions), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""ThermalGovernor against a fake sysfs tree, and its interplay with config reloads."""
+
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import unittest
+from dataclasses import asdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stream import RTSPStreamer, StreamConfig, ThermalGovernor  # noqa: E402
+
+
+class FakeSysfs:
+    """A temp directory laid out like the parts of /sys the governor reads."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.throttled_path = root / ThermalGovernor.THROTTLED_PATH
+        self.throttled_path.parent.mkdir(parents=True)
+
+    def set_temperatures(self, *celsius: float) -> None:
+        for index, value in enumerate(celsius):
+            zone = self.root / f"sys/class/thermal/thermal_zone{index}"
+            zone.mkdir(parents=True, exist_ok=True)
+            (zone / "temp").write_text(f"{int(value * 1000)}\n")
+
+    def set_throttled(self, flags: int) -> None:
+        self.throttled_path.write_text(f"{flags:#x}\n")
+
+
+class ThermalGovernorTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.sysfs = FakeSysfs(Path(tmp.name))
+        self.sysfs.set_temperatures(50.0)
+        self.sysfs.set_throttled(0)
+        self.governor = ThermalGovernor(levels=3, step_down_temp=75.0, step_up_temp=65.0,
+                                        hold=60.0, step_down_hold=20.0, sysfs_root=self.sysfs.root)
+
+    def test_reads_hottest_zone_and_throttle_flags(self):
+        self.sysfs.set_temperatures(48.5, 71.2)
+        self.sysfs.set_throttled(0x50005)
+        self.governor.update(now=0)
+        self.assertEqual(self.governor.temperature, 71.2)
+        self.assertEqual(self.governor.throttled, 0x50005)
+
+    def test_missing_sensors_never_step(self):
+        governor = ThermalGovernor(3, 75.0, 65.0, 60.0, sysfs_root=self.sysfs.root / "empty")
+        self.assertFalse(governor.update(now=0))
+        self.assertIsNone(governor.temperature)
+        self.assertIsNone(governor.throttled)
+
+    def test_steps_down_when_hot_with_a_hold_between_steps(self):
+        self.sysfs.set_temperatures(80.0)
+        self.assertTrue(self.governor.update(now=100))
+        self.assertEqual(self.governor.level, 1)
+        # Checks every 5 s must not run through the ladder before the step can help
+        for now in (105, 110, 115):
+            self.assertFalse(self.governor.update(now=now))
+        self.assertTrue(self.governor.update(now=120))
+        self.assertEqual(self.governor.level, 2)
+        self.governor.update(now=140)
+        self.governor.update(now=160)
+        self.assertEqual(self.governor.level, 3)  # Never beyond the last level
+
+    def test_active_throttling_steps_down_even_when_cool(self):
+        self.sysfs.set_throttled(0x4)
+        self.assertTrue(self.governor.update(now=0))
+        self.assertEqual(self.governor.level, 1)
+
+    def test_past_throttling_alone_does_not_step_down(self):
+        self.sysfs.set_throttled(0x40000)  # "Has throttled since boot" only
+        self.assertFalse(self.governor.update(now=0))
+
+    def test_steps_up_only_after_cooling_for_hold(self):
+        self.sysfs.set_temperatures(80.0)
+        self.governor.update(now=0)
+        self.sysfs.set_temperatures(70.0)  # Between the thresholds: stay
+        self.assertFalse(self.governor.update(now=20))
+        self.sysfs.set_temperatures(60.0)
+        self.assertFalse(self.governor.update(now=40))  # Cool, but only 40 s into the hold
+        self.assertTrue(self.governor.update(now=60))
+        self.assertEqual(self.governor.level, 0)
+
+
+class ThermalReloadTest(unittest.TestCase):
+    def test_reload_keeps_the_thermal_level(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = Path(tmp) / "stream.json"
+            config = StreamConfig(bitrate=8000000, thermal_governor=True)
+            streamer = RTSPStreamer(config, config_path=config_path)
+            streamer._applied_thermal_level = 3  # Default ladder caps bitrate at 1 Mbps
+            patches = []
+
+            def api(method, path, body=None):
+                patches.append((method, path, body))
+                return {}
+            streamer._api_request = api
+
+            config_path.write_text(json.dumps(asdict(StreamConfig(
+                bitrate=6000000, thermal_governor=True))))
+            with contextlib.redirect_stdout(io.StringIO()):
+                streamer.reload_config()
+
+        bitrates = [body["rpiCameraBitrate"] for method, _, body in patches
+                    if method == "PATCH" and body and "rpiCameraBitrate" in body]
+        self.assertEqual(bitrates, [6000000, 1000000])
+        self.assertEqual(streamer._applied_thermal_level, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""UDPImpairmentProxy drops and delays loopback datagrams reproducibly."""
+
+import random
+import socket
+import sys
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stream import UDPImpairmentProxy  # noqa: E402
+
+DATAGRAMS = 200
+SEED = 7
+
+
+class UDPImpairmentProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.upstream.bind(("127.0.0.1", 0))
+        self.upstream.settimeout(1)
+        self.addCleanup(self.upstream.close)
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.settimeout(1)
+        self.addCleanup(self.client.close)
+
+    def start_proxy(self, **impairment) -> tuple:
+        proxy = UDPImpairmentProxy(self.upstream.getsockname(), seed=SEED, **impairment)
+        port = proxy.start()
+        self.addCleanup(proxy.stop)
+        return proxy, ("127.0.0.1", port)
+
+    def receive_all(self, sock: socket.socket) -> list:
+        received = []
+        try:
+            while True:
+                received.append(sock.recv(2048))
+        except socket.timeout:
+            return received
+
+    def test_seeded_loss_is_reproducible(self):
+        loss = 0.2
+        proxy, address = self.start_proxy(loss=loss)
+        for i in range(DATAGRAMS):
+            self.client.sendto(i.to_bytes(4, "big"), address)
+            time.sleep(0.0005)  # Stay well inside the loopback socket buffers
+        received = self.receive_all(self.upstream)
+
+        # The same seed gives the same drop decisions: one draw per datagram,
+        # plus one for the jitter of each one forwarded
+        rng = random.Random(SEED)
+        expected = []
+        for i in range(DATAGRAMS):
+            if rng.random() >= loss:
+                expected.append(i)
+                rng.random()
+        self.assertEqual(proxy.forwarded, len(expected))
+        self.assertEqual(proxy.dropped, DATAGRAMS - len(expected))
+        self.assertEqual(sorted(int.from_bytes(data, "big") for data in received), expected)
+
+    def test_adds_the_delay_both_ways(self):
+        delay = 0.1
+        proxy, address = self.start_proxy(delay=delay)
+        sent = time.monotonic()
+        self.client.sendto(b"ping", address)
+        data, relay = self.upstream.recvfrom(2048)
+        arrived = time.monotonic()
+        self.assertEqual(data, b"ping")
+        self.assertGreaterEqual(arrived - sent, delay)
+
+        self.upstream.sendto(b"pong", relay)
+        self.assertEqual(self.client.recv(2048), b"pong")
+        self.assertGreaterEqual(time.monotonic() - arrived, delay)
+        self.assertEqual((proxy.forwarded, proxy.dropped), (2, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()